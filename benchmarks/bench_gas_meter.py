@@ -0,0 +1,375 @@
+"""
+Offline benchmarks for the Virtual Gas Meter integration.
+
+Runs the integration code against a minimal stand-in HomeAssistant and recorder
+(no event loop of a real instance, no database) and prints the timings as JSON:
+
+    python benchmarks/bench_gas_meter.py --sizes 10 10000 1000000 --output bench_output.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from homeassistant.const import __version__ as HA_VERSION
+from homeassistant.util import dt as dt_util
+
+import custom_components.gas_meter as gas_meter
+import custom_components.gas_meter.boiler_tracker as boiler_tracker
+import custom_components.gas_meter.file_handler as fh
+from custom_components.gas_meter.boiler_tracker import BoilerOnTimeTracker
+from custom_components.gas_meter.const import DOMAIN
+from custom_components.gas_meter.forecast import ConsumptionForecaster
+from custom_components.gas_meter.gas_consume import FIELDS, GasConsume
+from custom_components.gas_meter.rate_model import FIT_METHODS, fit_rate
+from custom_components.gas_meter.rollups import PERIOD_DAY, ConsumptionRollups
+from custom_components.gas_meter.write_queue import WriteQueue
+from custom_components.gas_meter.sensor import ConsumedGasSensor, GasDataSensor
+
+ENTRY_ID = "bench"
+BOILER = "switch.boiler"
+# One reading every 6 hours, the boiler toggling every `SWITCH_PERIOD` seconds
+READING_PERIOD = 6 * 3600
+SWITCH_PERIOD = 300
+CONCURRENT_CALLS = 20
+
+
+class StandInSnapshot:
+    """Replaces the MeterSnapshot; parts are collected and serialized only when timed."""
+
+    def __init__(self):
+        self.parts = {}
+
+    def register(self, name, data_func):
+        self.parts[name] = data_func
+
+    def async_schedule_save(self):
+        pass
+
+    def serialized(self):
+        return json.dumps({name: data_func() for name, data_func in self.parts.items()})
+
+
+class StandInUpdates:
+    """Replaces the UpdateDispatcher; entity state writes are timed separately."""
+
+    def async_schedule(self):
+        pass
+
+
+class StandInRecorder:
+    """Serves a synthetic, time-ordered boiler state history like get_significant_states."""
+
+    def __init__(self, executor):
+        self._executor = executor
+        self.states = []
+        self._times = []
+        self.queries = 0
+
+    def set_history(self, start, end, period):
+        self.states = [
+            SimpleNamespace(state="on" if index % 2 == 0 else "off", last_changed=dt_util.utc_from_timestamp(timestamp))
+            for index, timestamp in enumerate(range(int(start), int(end), period))
+        ]
+        self._times = [state.last_changed.timestamp() for state in self.states]
+
+    async def async_add_executor_job(self, target, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, target, *args)
+
+    def get_significant_states(self, hass, start_time, end_time, entity_ids, *args, **kwargs):
+        self.queries += 1
+        first = max(bisect_right(self._times, start_time.timestamp()) - 1, 0)
+        last = bisect_left(self._times, end_time.timestamp())
+        return {BOILER: self.states[first:last]}
+
+
+class StandInHass:
+    """Just enough of HomeAssistant for the services, sensors and file handler."""
+
+    def __init__(self, config_dir, executor):
+        self._executor = executor
+        self.data = {}
+        self.config = SimpleNamespace(
+            config_dir=config_dir,
+            debug=False,
+            path=lambda *parts: str(Path(config_dir, *parts)),
+            is_allowed_path=lambda path: False,
+        )
+        self.states = SimpleNamespace(get=lambda entity_id: None)
+        self.services = SimpleNamespace(handlers={})
+        self.services.async_register = (
+            lambda domain, service, handler, supports_response=None: self.services.handlers.__setitem__(service, handler)
+        )
+
+    @property
+    def loop(self):
+        return asyncio.get_running_loop()
+
+    def async_create_task(self, target):
+        return self.loop.create_task(target)
+
+    async def async_add_executor_job(self, target, *args):
+        return await self.loop.run_in_executor(self._executor, target, *args)
+
+
+def synthetic_history(size, end):
+    """GasConsume with `size` readings ending at `end`, derived fields computed."""
+    start = end - (size - 1) * READING_PERIOD
+    timestamps = array("d", (start + index * READING_PERIOD for index in range(size)))
+    columns = {key: array("d", [math.nan]) * size for key in FIELDS}
+    # Half of every interval the boiler is on, burning 0.02 m³/min
+    minutes = READING_PERIOD / 120
+    columns["consumed_gas"] = array("d", (1000 + index * minutes * 0.02 for index in range(size)))
+    columns["min_cumulated"] = array("d", (index * minutes for index in range(size)))
+    gas_consume = GasConsume()
+    gas_consume.__setstate__({"timestamps": timestamps, "columns": columns})
+    gas_consume.recompute(0)
+    return gas_consume
+
+
+async def measure(name, size, func, repeat):
+    """Runs the coroutine function `func` `repeat` times and summarizes the timings (ms)."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return {
+        "name": name,
+        "records": size,
+        "runs": repeat,
+        "min_ms": round(min(timings), 4),
+        "median_ms": round(statistics.median(timings), 4),
+        "mean_ms": round(statistics.fmean(timings), 4),
+        "max_ms": round(max(timings), 4),
+    }
+
+
+async def bench_size(size, repeat, executor, results):
+    now = dt_util.utcnow().timestamp()
+    with tempfile.TemporaryDirectory() as config_dir:
+        Path(config_dir, "custom_components", DOMAIN).mkdir(parents=True)
+        hass = StandInHass(config_dir, executor)
+        recorder = StandInRecorder(executor)
+        boiler_tracker.get_instance = lambda _hass: recorder
+        boiler_tracker.get_significant_states = recorder.get_significant_states
+        await gas_meter._register_services(hass)
+
+        gas_consume = synthetic_history(size, now - READING_PERIOD)
+        entry = SimpleNamespace(entry_id=ENTRY_ID, title="Bench", options={})
+        hass.config_entries = SimpleNamespace(async_get_entry=lambda entry_id: entry)
+        snapshot = StandInSnapshot()
+        tracker = BoilerOnTimeTracker(hass, ENTRY_ID, BOILER, snapshot)
+        # The tracker observed the boiler since the latest reading
+        for index, timestamp in enumerate(range(int(gas_consume.timestamps[-1]), int(now), SWITCH_PERIOD)):
+            tracker._append(timestamp, index % 2 == 0)
+        # The recorder only has to answer for the late readings inserted mid history
+        middle = gas_consume.timestamps[len(gas_consume) // 2]
+        recorder.set_history(middle - READING_PERIOD, middle + 2 * READING_PERIOD, SWITCH_PERIOD)
+        rollups = ConsumptionRollups(hass, ENTRY_ID, tracker, snapshot)
+        forecaster = ConsumptionForecaster(hass, ENTRY_ID, rollups, tracker)
+        hass.data[DOMAIN] = {ENTRY_ID: {
+            "snapshot": snapshot, "boiler_entity": BOILER, "boiler_tracker": tracker, "rollups": rollups, "updates": StandInUpdates(),
+            "forecaster": forecaster,
+            "write_queue": WriteQueue(
+                hass, ENTRY_ID, lambda readings: gas_meter._async_apply_readings(hass, ENTRY_ID, readings)
+            ),
+        }}
+
+        path = fh.get_gas_log_path(hass, ENTRY_ID)
+        small_repeat = repeat if size < 100_000 else 1
+
+        async def save_full():
+            path.unlink(missing_ok=True)
+            gas_consume.persisted = 0
+            await fh.save_gas_actualdata(gas_consume, hass, ENTRY_ID)
+
+        results.append(await measure("save_gas_actualdata (full write)", size, save_full, small_repeat))
+
+        async def load():
+            await fh.load_gas_actualdata(hass, ENTRY_ID)
+
+        results.append(await measure("load_gas_actualdata", size, load, small_repeat))
+
+        # Services and sensors share the cached instance
+        await fh.async_get_gas_consume(hass, ENTRY_ID)
+        trigger = hass.services.handlers["trigger_gas_update"]
+        reading = {"time": gas_consume.timestamps[-1], "gas": gas_consume.column("consumed_gas")[-1]}
+
+        async def trigger_latest():
+            reading["time"] += 60
+            reading["gas"] += 0.01
+            await trigger(SimpleNamespace(data={
+                "datetime": dt_util.utc_from_timestamp(reading["time"]), "consumed_gas": reading["gas"],
+            }))
+
+        results.append(await measure("handle_trigger_service (new latest reading)", size, trigger_latest, repeat))
+
+        # Same with the profiling hooks on, to keep their overhead in check
+        metrics = hass.data[DOMAIN][ENTRY_ID]["metrics"]
+        metrics.profiling = True
+        results.append(await measure("handle_trigger_service (profiling on)", size, trigger_latest, repeat))
+        results[-1]["metrics"] = metrics.as_dict()
+        metrics.profiling = False
+
+        async def trigger_concurrent():
+            await asyncio.gather(*(trigger_latest() for _ in range(CONCURRENT_CALLS)))
+
+        results.append(await measure(
+            f"handle_trigger_service ({CONCURRENT_CALLS} overlapping calls)", size, trigger_concurrent, repeat
+        ))
+        results[-1]["write_queue"] = hass.data[DOMAIN][ENTRY_ID]["write_queue"].stats
+
+        cached = await fh.async_get_gas_consume(hass, ENTRY_ID)
+        late = {"time": cached.timestamps[len(cached) // 2] + 1}
+
+        async def trigger_late():
+            late["time"] += 1
+            await trigger(SimpleNamespace(data={
+                "datetime": dt_util.utc_from_timestamp(late["time"]),
+                "consumed_gas": cached.column("consumed_gas")[len(cached) // 2],
+            }))
+
+        recorder.queries = 0
+        results.append(await measure("handle_trigger_service (late reading, mid history)", size, trigger_late, small_repeat))
+        results[-1]["recorder_queries"] = recorder.queries
+
+        sensor = GasDataSensor(hass, entry)
+
+        async def sensor_update():
+            await sensor.async_update()
+
+        results.append(await measure("GasDataSensor.async_update", size, sensor_update, repeat))
+
+        async def sensor_attributes():
+            json.dumps(sensor.extra_state_attributes)
+
+        results.append(await measure("GasDataSensor.extra_state_attributes (serialized)", size, sensor_attributes, repeat))
+
+        # The template sensor was replaced by the native ConsumedGasSensor; time its state render
+        consumed_gas = ConsumedGasSensor(hass, entry)
+
+        async def consumed_gas_render():
+            consumed_gas.native_value
+
+        results.append(await measure("ConsumedGasSensor.native_value", size, consumed_gas_render, repeat))
+
+        # Runs in the executor; intervals older than the hourly/daily retention are spread
+        # day or month-wise, but the 1M history still takes seconds, so only time smaller ones.
+        if size <= 100_000:
+            async def rebuild_rollups():
+                await rollups.async_rebuild_metered(cached)
+
+            results.append(await measure("ConsumptionRollups.async_rebuild_metered", size, rebuild_rollups, small_repeat))
+
+        async def rollups_query():
+            rollups.query(PERIOD_DAY)
+
+        results.append(await measure("ConsumptionRollups.query (day)", size, rollups_query, repeat))
+
+        # A new reading rebuilds the profile; the forecast sensors of a batch then hit the cache
+        async def forecast_recompute():
+            forecaster.records_changed(cached)
+            forecaster.forecast()
+
+        results.append(await measure("ConsumptionForecaster.forecast (after a reading)", size, forecast_recompute, repeat))
+
+        async def forecast_cached():
+            forecaster.forecast()
+
+        results.append(await measure("ConsumptionForecaster.forecast (cached)", size, forecast_cached, repeat))
+
+        # What startup reads instead of the record log
+        entry_data = hass.data[DOMAIN][ENTRY_ID]
+        snapshot.register("meter", lambda: gas_meter._meter_snapshot(entry_data))
+        snapshot_bytes = len(snapshot.serialized())
+
+        async def snapshot_serialize():
+            snapshot.serialized()
+
+        result = await measure("MeterSnapshot (serialized)", size, snapshot_serialize, repeat)
+        result["bytes"] = snapshot_bytes
+        results.append(result)
+
+        for method in FIT_METHODS:
+            async def fit():
+                fit_rate(cached, method)
+
+            results.append(await measure(f"fit_rate ({method})", size, fit, repeat))
+
+
+async def bench_switch_history(transitions, repeat, executor, results):
+    """Boiler on-time over a dense switch history: tracker lookups and the recorder sweep."""
+    now = dt_util.utcnow().timestamp()
+    start = now - transitions * SWITCH_PERIOD
+    recorder = StandInRecorder(executor)
+    recorder.set_history(start, now, SWITCH_PERIOD)
+    boiler_tracker.get_instance = lambda _hass: recorder
+    boiler_tracker.get_significant_states = recorder.get_significant_states
+    hass = StandInHass(tempfile.gettempdir(), executor)
+    tracker = BoilerOnTimeTracker(hass, ENTRY_ID, BOILER, StandInSnapshot())
+    for state in recorder.states:
+        tracker._append(state.last_changed.timestamp(), state.state == "on")
+
+    start_time = dt_util.utc_from_timestamp(start)
+    end_time = dt_util.utc_from_timestamp(now)
+
+    async def observed():
+        tracker.on_seconds_observed(start_time, end_time)
+
+    results.append(await measure("BoilerOnTimeTracker.on_seconds_observed", transitions, observed, repeat))
+
+    async def recorder_single():
+        await boiler_tracker.async_recorder_on_seconds_for_ranges(hass, BOILER, [(start, now)])
+
+    results.append(await measure("async_recorder_on_seconds_for_ranges (full range)", transitions, recorder_single, repeat))
+
+    ranges = [(start + offset, start + offset + READING_PERIOD) for offset in range(0, int(now - start), READING_PERIOD)]
+
+    async def recorder_ranges():
+        await boiler_tracker.async_recorder_on_seconds_for_ranges(hass, BOILER, ranges)
+
+    results.append(await measure(f"async_recorder_on_seconds_for_ranges ({len(ranges)} ranges)", transitions, recorder_ranges, repeat))
+
+
+async def main(args):
+    results = []
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        for size in args.sizes:
+            await bench_size(size, args.repeat, executor, results)
+        for transitions in args.switch_transitions:
+            await bench_switch_history(transitions, args.repeat, executor, results)
+    return {
+        "python": platform.python_version(),
+        "homeassistant": HA_VERSION,
+        "platform": platform.platform(),
+        "started": dt_util.utcnow().isoformat(),
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 10_000, 1_000_000], help="Synthetic history sizes (records).")
+    parser.add_argument("--switch-transitions", type=int, nargs="+", default=[10_000, 1_000_000], help="Boiler on/off transitions in the dense switch histories.")
+    parser.add_argument("--repeat", type=int, default=20, help="Runs per benchmark (1 for the slow ones on large histories).")
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout.")
+    args = parser.parse_args()
+
+    report = json.dumps(asyncio.run(main(args)), indent=2)
+    if args.output:
+        Path(args.output).write_text(report + "\n", encoding="utf-8")
+    else:
+        print(report)
@@ -1,26 +1,212 @@
 import logging
-from homeassistant.core import HomeAssistant, ServiceCall
-from homeassistant.components.recorder.history import get_significant_states
-from homeassistant.components.recorder import get_instance
+from pathlib import Path
+from homeassistant.core import HomeAssistant, ServiceCall, SupportsResponse, callback
 from homeassistant.util import dt as dt_util
-from homeassistant.helpers.discovery import async_load_platform
 from homeassistant.config_entries import ConfigEntry
+from homeassistant.exceptions import ServiceValidationError, Unauthorized, UnknownUser
 from homeassistant.helpers import entity_registry as er
 import custom_components.gas_meter.file_handler as fh
+from .gas_consume import format_record, from_timestamp, to_timestamp
+from .boiler_tracker import BoilerOnTimeTracker
+from .rate_model import FIT_METHODS, RATE_MODEL_CUMULATIVE, RATE_MODEL_WLS, fit_rate
+from .forecast import ConsumptionForecaster
+from .export import EXPORT_CSV, EXPORT_FORMATS, default_export_path, export_records
+from .rollups import PERIODS, ConsumptionRollups, intervals_around
+from .snapshot import MeterSnapshot
+from .update_dispatcher import UpdateDispatcher
+from .write_queue import WriteQueue
 from .const import (
     DOMAIN, CONF_BOILER_ENTITY, CONF_BOILER_AVERAGE, CONF_LATEST_GAS_DATA,
-    DEFAULT_BOILER_AV_H, DEFAULT_BOILER_AV_M, DEFAULT_LATEST_GAS_DATA, DEFAULT_BOILER_ENTITY
+    DEFAULT_BOILER_AV_H, DEFAULT_LATEST_GAS_DATA, DEFAULT_RECORDS_PAGE, MAX_RECORDS_PAGE,
+    CONF_ENTRY_ID, CONF_RATE_MODEL, CONF_RATE_HALF_LIFE, DEFAULT_RATE_MODEL, DEFAULT_RATE_HALF_LIFE,
+    CONF_REFRESH_INTERVAL, DEFAULT_REFRESH_INTERVAL, CONF_UPDATE_DEBOUNCE, DEFAULT_UPDATE_DEBOUNCE,
+    IMPORT_DIRECTORY, EXPORT_DIRECTORY
 )
 
 _LOGGER = logging.getLogger(__name__)
 
+def _resolve_entry_id(hass: HomeAssistant, call: ServiceCall):
+    """Returns the config entry a service call targets (optional when only one meter is set up)."""
+    loaded = [entry_id for entry_id, entry_data in hass.data.get(DOMAIN, {}).items() if "boiler_tracker" in entry_data]
+    entry_id = call.data.get(CONF_ENTRY_ID)
+    if entry_id is None:
+        if len(loaded) != 1:
+            raise ServiceValidationError(
+                f"'{CONF_ENTRY_ID}' is required when {len(loaded)} gas meters are set up"
+            )
+        return loaded[0]
+    if entry_id not in loaded:
+        raise ServiceValidationError(f"Gas meter config entry '{entry_id}' is not loaded")
+    return entry_id
+
+async def _async_resolve_path(hass: HomeAssistant, path, *directories):
+    """
+    Resolves a service `path` against the config directory. It has to stay inside one of
+    `directories` (relative to the config directory) or be in an allowlisted external
+    directory.
+    """
+    path = Path(hass.config.path(path))
+    roots = [Path(hass.config.path(directory)) for directory in directories]
+
+    def _allowed():
+        resolved = path.resolve()
+        return (any(resolved.is_relative_to(root.resolve()) for root in roots)
+                or hass.config.is_allowed_path(str(path)))
+
+    if not await hass.async_add_executor_job(_allowed):
+        raise ServiceValidationError(f"Access to {path} is not allowed")
+    return path
+
+def _admin_only(hass: HomeAssistant, handler):
+    """
+    The admin check of homeassistant.helpers.service.async_register_admin_service, for
+    services that return a response (which that helper can't register).
+    """
+    async def _async_handle(call: ServiceCall):
+        if call.context.user_id:
+            user = await hass.auth.async_get_user(call.context.user_id)
+            if user is None:
+                raise UnknownUser(context=call.context)
+            if not user.is_admin:
+                raise Unauthorized(context=call.context)
+        return await handler(call)
+    return _async_handle
+
+async def _async_measure_intervals(tracker, gas_consume, stale):
+    """Boiler on-minutes of the intervals ending at the `stale` record indices."""
+    timestamps = gas_consume.timestamps
+    seconds = await tracker.async_on_seconds_for_intervals(
+        [
+            (dt_util.utc_from_timestamp(timestamps[index - 1]), dt_util.utc_from_timestamp(timestamps[index]))
+            for index in stale
+        ]
+    )
+    return {index: on_seconds / 60 for index, on_seconds in zip(stale, seconds)}
+
+@callback
+def _update_latest(hass: HomeAssistant, entry_id, gas_consume):
+    """Takes the latest reading from the newest record and the rate from the configured rate model."""
+    entry_data = hass.data[DOMAIN][entry_id]
+    if not gas_consume:
+        return
+    latest_record = gas_consume[-1]
+    # Transitions since the second-newest reading are kept, so deleting the newest (e.g.
+    # mistyped) reading doesn't lose the on-time since the one before it
+    entry_data["boiler_tracker"].prune(from_timestamp(gas_consume.timestamps[max(len(gas_consume) - 2, 0)]))
+    entry_data["latest_gas_update"] = latest_record["datetime"]
+    entry_data["latest_gas_data"] = latest_record["consumed_gas"]
+    if "average m3/min" in latest_record:
+        entry_data["average_m3_per_min"] = latest_record["average m3/min"]
+
+    options = hass.config_entries.async_get_entry(entry_id).options
+    model = options.get(CONF_RATE_MODEL, DEFAULT_RATE_MODEL)
+    entry_data.pop("rate_fit", None)
+    if model != RATE_MODEL_CUMULATIVE:
+        fit = fit_rate(gas_consume, model, options.get(CONF_RATE_HALF_LIFE, DEFAULT_RATE_HALF_LIFE))
+        entry_data["rate_fit"] = fit
+        if fit["rate"] is not None:
+            entry_data["average_m3_per_min"] = fit["rate"]
+    entry_data["forecaster"].records_changed(gas_consume)
+    entry_data["snapshot"].async_schedule_save()
+
+def _meter_snapshot(entry_data):
+    """Snapshot part with the latest reading and rate, so entities have values before the log is read."""
+    return {
+        "latest_gas_update": entry_data["latest_gas_update"].isoformat(),
+        "latest_gas_data": entry_data["latest_gas_data"],
+        "average_m3_per_min": entry_data["average_m3_per_min"],
+        "rate_fit": entry_data.get("rate_fit"),
+    }
+
+async def _async_reconcile(hass: HomeAssistant, entry_id, meter, rollups_restored):
+    """
+    Reads the record log after startup and brings the restored state in line with it.
+    `meter` is the restored meter part (None if there was none).
+    """
+    entry_data = hass.data[DOMAIN][entry_id]
+    gas_consume = await fh.async_get_gas_consume(hass, entry_id)
+    if not gas_consume:
+        # A new meter: the reading entered during setup becomes the first record
+        if entry_data["latest_gas_data"] != 0:
+            _LOGGER.info("Adding the first gas record for %s", entry_id)
+            await _async_apply_readings(
+                hass, entry_id, [(entry_data["latest_gas_update"], entry_data["latest_gas_data"])]
+            )
+    else:
+        # Count the boiler on-time HA didn't observe since the latest reading (e.g. before
+        # an upgrade or while it was down), so the live estimates continue where they were
+        latest = from_timestamp(gas_consume.timestamps[-1])
+        await entry_data["boiler_tracker"].async_fill_gaps(latest)
+        if meter is None or to_timestamp(entry_data["latest_gas_update"]) != gas_consume.timestamps[-1]:
+            _update_latest(hass, entry_id, gas_consume)
+        else:
+            entry_data["forecaster"].records_changed(gas_consume)
+        if not rollups_restored:
+            await entry_data["rollups"].async_rebuild_metered(gas_consume)
+    # Also lets the records sensor read the (now cached) log
+    entry_data["updates"].async_schedule()
+
+async def _async_apply_readings(hass: HomeAssistant, entry_id, readings):
+    """
+    Adds or corrects (datetime, consumed_gas) readings with a single recompute and save.
+    Only called from the meter's WriteQueue, so no other mutation runs concurrently.
+    """
+    entry_data = hass.data[DOMAIN][entry_id]
+    gas_consume = await fh.async_get_gas_consume(hass, entry_id)
+    try:
+        timestamps = [to_timestamp(when) for when, _consumed_gas in readings]
+        old_intervals = intervals_around(gas_consume, timestamps)
+        if len(readings) == 1:
+            # A reading with the timestamp of an existing record corrects it; an older
+            # one is inserted at its place and only the intervals it splits are measured.
+            first_changed, stale = gas_consume.upsert(*readings[0])
+        else:
+            first_changed, stale = gas_consume.merge_readings(readings)
+        # Measure every new/split interval; unobserved parts come from one recorder query
+        minutes = await _async_measure_intervals(entry_data["boiler_tracker"], gas_consume, stale)
+        gas_consume.recompute(first_changed, minutes)
+        entry_data["rollups"].replace_intervals(old_intervals, intervals_around(gas_consume, timestamps))
+        await fh.async_save_gas_consume(hass, entry_id, gas_consume)
+    except Exception:
+        # Don't keep half-applied readings in the shared cache.
+        fh.invalidate_gas_consume(hass, entry_id)
+        raise
+    _update_latest(hass, entry_id, gas_consume)
+    entry_data["updates"].async_schedule()
+    return gas_consume
+
+async def _async_delete_reading(hass: HomeAssistant, entry_id, when):
+    """Deletes the reading at `when`; the neighbouring intervals merge. Run through the WriteQueue."""
+    entry_data = hass.data[DOMAIN][entry_id]
+    gas_consume = await fh.async_get_gas_consume(hass, entry_id)
+    timestamp = to_timestamp(when)
+    old_intervals = intervals_around(gas_consume, [timestamp])
+    try:
+        index = gas_consume.delete(when)
+    except KeyError:
+        raise ServiceValidationError(f"There is no gas record at {when}") from None
+    try:
+        gas_consume.recompute(index)
+        entry_data["rollups"].replace_intervals(old_intervals, intervals_around(gas_consume, [timestamp]))
+        await fh.async_save_gas_consume(hass, entry_id, gas_consume)
+    except Exception:
+        fh.invalidate_gas_consume(hass, entry_id)
+        raise
+    if index == len(gas_consume) and gas_consume:
+        # The latest reading moved back; on-time the tracker no longer has since the new
+        # latest reading (after deleting several) comes from the recorder
+        await entry_data["boiler_tracker"].async_fill_gaps(from_timestamp(gas_consume.timestamps[-1]))
+    _update_latest(hass, entry_id, gas_consume)
+    entry_data["updates"].async_schedule()
+
 async def _register_services(hass: HomeAssistant):
     """Register services for gas meter integration."""
     
     async def handle_trigger_service(call: ServiceCall):
         """Handle service call to update gas meter data."""
         try:
-            gas_consume = await fh.load_gas_actualdata(hass)
+            entry_id = _resolve_entry_id(hass, call)
+            entry_data = hass.data[DOMAIN][entry_id]
             datetime_received = call.data.get("datetime")
             if datetime_received is None:
                 _LOGGER.error("Missing 'datetime' in service call data.")
@@ -47,102 +233,186 @@ async def _register_services(hass: HomeAssistant):
                     _LOGGER.error(f"Invalid 'consumed_gas' value: {gas_new_data}")
                     return
 
-            gas_consume.add_record(gas_new_datetime, gas_new_data)
+            # Overlapping calls are serialized and merged into one recompute and save
+            await entry_data["write_queue"].async_add_readings([(gas_new_datetime, gas_new_data)])
             _LOGGER.info("Gas meter data updated successfully.")
 
-            if len(gas_consume) > 1:
-                gas_prev_datetime = gas_consume[-2]["datetime"]
-                gas_prev_data = gas_consume[-2]["consumed_gas"]
-
-                # Get the state history of the switch between the two timestamps
-                start_time = dt_util.as_utc(gas_prev_datetime)
-                end_time = dt_util.as_utc(gas_new_datetime)
-                entity_id = f"{DOMAIN}.boiler_entity"
-                history_list = await get_instance(hass).async_add_executor_job(
-                    get_significant_states, hass, start_time, end_time, [entity_id]
-                    )
-
-                # Calculate the total time the switch was "on"
-                total_on_time = 0
-                previous_state = None
-                previous_time = start_time
-                for state in history_list.get(entity_id, []):
-                    current_time = state.last_changed
-
-                    if previous_state == "on":
-                        total_on_time += (current_time - previous_time).total_seconds()
-
-                    previous_state = state.state
-                    previous_time = current_time
-
-                # Handle the last segment
-                if previous_state == "on":
-                    total_on_time += (end_time - previous_time).total_seconds()
-
-                total_min = total_on_time / 60  # Total time in minutes
-
-                # Count m3/min for the current interval ("m3/min for interval")
-                gas_data_diff = gas_new_data - gas_prev_data
-                if total_min:
-                    gas_consume[-1]["m3/min for interval"] = gas_data_diff / total_min
-                
-                # Count how much gas was consumed from the first data till the last data ("consumed_gas_cumulated")
-                consumed_gas_cumulated = gas_new_data - gas_consume[0]["consumed_gas"]
-                gas_consume[-1]["consumed_gas_cumulated"] = consumed_gas_cumulated
-
-                # Count how many minutes the boiler was working starting from the first data till the last data ("min_cumulated")
-                if len(gas_consume) == 2:
-                    min_cumulated = total_min
-                elif len(gas_consume) > 2:
-                    min_cumulated = total_min + gas_consume[-2]["min_cumulated"]
-                gas_consume[-1]["min_cumulated"] = min_cumulated
-
-                # Count m3/min for the whole period between the first data till the last data ("average m3/min")
-                if min_cumulated:
-                    av_min = consumed_gas_cumulated / min_cumulated
-                    gas_consume[-1]["average m3/min"] = av_min
-
-                    hass.states.async_set(f"{DOMAIN}.average_m3_per_min", av_min)
-                    
-            hass.states.async_set(f"{DOMAIN}.latest_gas_update", gas_new_datetime)
-            hass.states.async_set(f"{DOMAIN}.latest_gas_data", gas_new_data)
-
-            # Save updated gas consumption
-            await fh.save_gas_actualdata(gas_consume, hass)
-
+        except ServiceValidationError:
+            raise
         except Exception as e:
             _LOGGER.error("Error in handle_trigger_service: %s", str(e))
             raise
             
     async def read_gas_actualdata_file(call: ServiceCall):
-        """Read and log gas meter data."""
+        """Read the gas meter data, log a summary and refresh the sensors."""
         try:
-            gas_consume = await fh.load_gas_actualdata(hass)
-            for record in gas_consume:
-                _LOGGER.info("Gas record: %s", record)
-            # Get the GasDataSensor entity object
-            entity_registry = er.async_get(hass)
-            gas_data_sensor_entity_id = entity_registry.async_get_entity_id("sensor", DOMAIN, "gas_consumption_data")
-
-            if gas_data_sensor_entity_id:
-                gas_data_sensor_entity = hass.states.get(gas_data_sensor_entity_id)
-                if gas_data_sensor_entity:
-                    # Trigger the sensor's async_update()
-                    entity = hass.data["entity_components"]["sensor"].get_entity(gas_data_sensor_entity_id)
-                    _LOGGER.info(f"Entity component for GasDataSensor: {entity}")
-                    if entity:
-                        await entity.async_update()
-                        _LOGGER.info("GasDataSensor updated successfully.")
-                    else:
-                        _LOGGER.warning(f"Could not get entity from entity component for {gas_data_sensor_entity_id}")
-                else:
-                    _LOGGER.warning(f"Could not get state for {gas_data_sensor_entity_id}")
+            entry_id = _resolve_entry_id(hass, call)
+            gas_consume = await fh.async_get_gas_consume(hass, entry_id)
+            # Single records only at debug level; use export_records to get them all
+            if gas_consume:
+                _LOGGER.info(
+                    "%d gas records from %s to %s, latest: %s",
+                    len(gas_consume), gas_consume[0]["datetime"], gas_consume[-1]["datetime"], gas_consume[-1],
+                )
             else:
-                _LOGGER.warning("GasDataSensor entity not found in registry.")
+                _LOGGER.info("No gas records")
+            if _LOGGER.isEnabledFor(logging.DEBUG):
+                for record in gas_consume[-DEFAULT_RECORDS_PAGE:]:
+                    _LOGGER.debug("Gas record: %s", record)
+            hass.data[DOMAIN][entry_id]["updates"].async_schedule()
+        except ServiceValidationError:
+            raise
         except Exception as e:
             _LOGGER.error("Error in read_gas_actualdata_file: %s", str(e))
             raise
             
+    async def get_records(call: ServiceCall):
+        """Return a page of (formatted) gas records, newest first."""
+        gas_consume = await fh.async_get_gas_consume(hass, _resolve_entry_id(hass, call))
+        offset = max(int(call.data.get("offset", 0)), 0)
+        limit = min(max(int(call.data.get("limit", DEFAULT_RECORDS_PAGE)), 1), MAX_RECORDS_PAGE)
+        start = call.data.get("start")
+        end = call.data.get("end")
+        if isinstance(start, str):
+            start = fh.string_to_datetime(start)
+        if isinstance(end, str):
+            end = fh.string_to_datetime(end)
+        indices = gas_consume.index_range(start, end)
+        # Newest first
+        page = indices[::-1][offset:offset + limit]
+        records = [format_record(gas_consume[index]) for index in page]
+        return {"total": len(indices), "offset": offset, "records": records}
+
+    async def import_readings(call: ServiceCall):
+        """Import many (historical) readings at once with a single recompute and save."""
+        entry_id = _resolve_entry_id(hass, call)
+        entry_data = hass.data[DOMAIN][entry_id]
+        readings = []
+        try:
+            if call.data.get("file"):
+                # Exports can be read back; configuration files can't be read at all
+                path = await _async_resolve_path(hass, call.data["file"], IMPORT_DIRECTORY, EXPORT_DIRECTORY)
+                readings.extend(await hass.async_add_executor_job(fh.read_readings_file, path))
+            readings.extend(fh.parse_readings(call.data.get("readings", [])))
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            raise ServiceValidationError(f"Invalid readings to import: {e}") from e
+        if not readings:
+            raise ServiceValidationError("Provide readings to import via 'file' or 'readings'")
+
+        try:
+            gas_consume = await entry_data["write_queue"].async_add_readings(readings)
+        except Exception as e:
+            _LOGGER.error("Error in import_readings: %s", str(e))
+            raise
+        _LOGGER.info("Imported %d gas readings (%d records in total).", len(readings), len(gas_consume))
+        return {"imported": len(readings), "records": len(gas_consume)}
+
+    async def delete_reading(call: ServiceCall):
+        """Delete the reading with the given timestamp; the neighbouring intervals merge."""
+        entry_id = _resolve_entry_id(hass, call)
+        when = call.data["datetime"]
+        if isinstance(when, str):
+            when = fh.string_to_datetime(when)
+        try:
+            await hass.data[DOMAIN][entry_id]["write_queue"].async_run(
+                lambda: _async_delete_reading(hass, entry_id, when)
+            )
+        except ServiceValidationError:
+            raise
+        except Exception as e:
+            _LOGGER.error("Error in delete_reading: %s", str(e))
+            raise
+        _LOGGER.info("Deleted the gas record at %s.", when)
+
+    async def fit_rate_service(call: ServiceCall):
+        """Fit the gas rate over all intervals with the given model and return it."""
+        gas_consume = await fh.async_get_gas_consume(hass, _resolve_entry_id(hass, call))
+        method = call.data.get("method", RATE_MODEL_WLS)
+        if method not in FIT_METHODS:
+            raise ServiceValidationError(f"'method' must be one of {', '.join(FIT_METHODS)}")
+        return fit_rate(
+            gas_consume,
+            method,
+            float(call.data.get("half_life_days", DEFAULT_RATE_HALF_LIFE)),
+            float(call.data.get("confidence", 0.95)),
+        )
+
+    async def get_consumption(call: ServiceCall):
+        """Return the hourly, daily or monthly consumption buckets of a time range."""
+        entry_id = _resolve_entry_id(hass, call)
+        period = call.data.get("period", "day")
+        if period not in PERIODS:
+            raise ServiceValidationError(f"'period' must be one of {', '.join(PERIODS)}")
+        start = call.data.get("start")
+        end = call.data.get("end")
+        if isinstance(start, str):
+            start = fh.string_to_datetime(start)
+        if isinstance(end, str):
+            end = fh.string_to_datetime(end)
+        buckets = hass.data[DOMAIN][entry_id]["rollups"].query(period, start, end)
+        return {"period": period, "buckets": buckets}
+
+    async def export_records_service(call: ServiceCall):
+        """Stream the records and their interval columns of a time range to a file under the config directory."""
+        entry_id = _resolve_entry_id(hass, call)
+        export_format = call.data.get("format", EXPORT_CSV)
+        if export_format not in EXPORT_FORMATS:
+            raise ServiceValidationError(f"'format' must be one of {', '.join(EXPORT_FORMATS)}")
+        start = call.data.get("start")
+        end = call.data.get("end")
+        if isinstance(start, str):
+            start = fh.string_to_datetime(start)
+        if isinstance(end, str):
+            end = fh.string_to_datetime(end)
+        if call.data.get("path"):
+            # Never anywhere else under the config directory, where it could replace configuration
+            path = await _async_resolve_path(hass, call.data["path"], EXPORT_DIRECTORY)
+        else:
+            path = default_export_path(hass, entry_id, export_format)
+
+        async def _async_export():
+            gas_consume = await fh.async_get_gas_consume(hass, entry_id)
+            return await hass.async_add_executor_job(export_records, gas_consume, path, export_format, start, end)
+
+        # Queued like a mutation, so the records can't change while they are written out
+        try:
+            records = await hass.data[DOMAIN][entry_id]["write_queue"].async_run(_async_export)
+        except FileExistsError as e:
+            raise ServiceValidationError(f"{path} already exists; choose another path") from e
+        _LOGGER.info("Exported %d gas records to %s", records, path)
+        return {"path": str(path), "format": export_format, "records": records}
+
+    async def forecast(call: ServiceCall):
+        """Return the day, week and billing period projections and optionally the expected reading at a time."""
+        entry_id = _resolve_entry_id(hass, call)
+        entry_data = hass.data[DOMAIN][entry_id]
+        forecaster = entry_data["forecaster"]
+        result = dict(forecaster.forecast())
+        at = call.data.get("at")
+        if at is not None:
+            if isinstance(at, str):
+                at = fh.string_to_datetime(at)
+            at = dt_util.as_utc(at)
+            # The records are only needed for times before the latest reading
+            gas_consume = None
+            if at < entry_data["latest_gas_update"]:
+                gas_consume = await fh.async_get_gas_consume(hass, entry_id)
+            reading = forecaster.expected_reading(at, gas_consume)
+            result["expected_reading"] = {
+                "at": dt_util.as_local(at).isoformat(),
+                "reading": round(reading, 3) if reading is not None else None,
+            }
+        return result
+
+    async def set_profiling(call: ServiceCall):
+        """Turn the timing and byte/row counters of a meter on or off; optionally return them."""
+        metrics = hass.data[DOMAIN][_resolve_entry_id(hass, call)]["metrics"]
+        if call.data.get("reset", False):
+            metrics.reset()
+        metrics.profiling = call.data["enabled"]
+        _LOGGER.info("Profiling %s", "enabled" if metrics.profiling else "disabled")
+        return metrics.as_dict()
+
     # Register the services
     hass.services.async_register(
         DOMAIN, "trigger_gas_update", handle_trigger_service
@@ -150,25 +420,49 @@ async def _register_services(hass: HomeAssistant):
     hass.services.async_register(
         DOMAIN, "read_gas_actualdata_file", read_gas_actualdata_file
     )
+    hass.services.async_register(
+        DOMAIN, "get_records", get_records, supports_response=SupportsResponse.ONLY
+    )
+    hass.services.async_register(
+        DOMAIN, "import_readings", _admin_only(hass, import_readings), supports_response=SupportsResponse.OPTIONAL
+    )
+    hass.services.async_register(
+        DOMAIN, "delete_reading", delete_reading
+    )
+    hass.services.async_register(
+        DOMAIN, "fit_rate", fit_rate_service, supports_response=SupportsResponse.ONLY
+    )
+    hass.services.async_register(
+        DOMAIN, "get_consumption", get_consumption, supports_response=SupportsResponse.ONLY
+    )
+    hass.services.async_register(
+        DOMAIN, "export_records", _admin_only(hass, export_records_service), supports_response=SupportsResponse.OPTIONAL
+    )
+    hass.services.async_register(
+        DOMAIN, "forecast", forecast, supports_response=SupportsResponse.ONLY
+    )
+    hass.services.async_register(
+        DOMAIN, "set_profiling", set_profiling, supports_response=SupportsResponse.OPTIONAL
+    )
 
 async def async_setup(hass: HomeAssistant, config: dict):
-    """Set up the virtual gas meter integration (legacy YAML setup)."""
+    """Set up the virtual gas meter integration (services are shared by all meters)."""
     _LOGGER.info("Loading Virtual Gas Meter integration...")
     await _register_services(hass)
-
-    # Set initial states for the sensors
-    now = dt_util.now()
-    hass.states.async_set(f"{DOMAIN}.latest_gas_update", now)
-    hass.states.async_set(f"{DOMAIN}.latest_gas_data", DEFAULT_LATEST_GAS_DATA)
-    hass.states.async_set(f"{DOMAIN}.average_m3_per_min", DEFAULT_BOILER_AV_M)
-    hass.states.async_set(f"{DOMAIN}.boiler_entity", DEFAULT_BOILER_ENTITY)
-
-    await async_load_platform(hass, "sensor", DOMAIN, {}, config)
     return True
 
 async def async_setup_entry(hass: HomeAssistant, config_entry: ConfigEntry):
-    """Set up the integration from a config entry (UI setup)."""
-    await _register_services(hass)
+    """Set up one gas meter from a config entry (UI setup)."""
+    entry_id = config_entry.entry_id
+
+    # Entities of the former single-meter setup had fixed unique_ids; scope them to this entry
+    @callback
+    def _migrate_unique_id(entity_entry):
+        if entity_entry.unique_id.startswith(f"{entry_id}_"):
+            return None
+        return {"new_unique_id": f"{entry_id}_{entity_entry.unique_id}"}
+
+    await er.async_migrate_entries(hass, entry_id, _migrate_unique_id)
 
     # Retrieve user input values
     boiler_entity = config_entry.data.get(CONF_BOILER_ENTITY)
@@ -177,26 +471,86 @@ async def async_setup_entry(hass: HomeAssistant, config_entry: ConfigEntry):
     latest_gas_data = config_entry.data.get(CONF_LATEST_GAS_DATA, DEFAULT_LATEST_GAS_DATA)
     now = dt_util.now()
 
-    # Set initial states for the sensors
-    hass.states.async_set(f"{DOMAIN}.boiler_entity", boiler_entity)
-    hass.states.async_set(f"{DOMAIN}.average_m3_per_min", boiler_av_min)
-    hass.states.async_set(f"{DOMAIN}.latest_gas_data", latest_gas_data)
-    hass.states.async_set(f"{DOMAIN}.latest_gas_update", now)
-
-    # Add the first record to the file if latest_gas_data is not 0
-    if latest_gas_data != 0:
-        service_data = {
-            "datetime": now,
-            "consumed_gas": latest_gas_data,
-        }
-        _LOGGER.info("Calling handle_trigger_service to add the first gas record.")
-        await hass.services.async_call(DOMAIN, "trigger_gas_update", service_data, blocking=True)
+    # Derived state saved at the last run; one small read instead of replaying the record log
+    snapshot = MeterSnapshot(hass, entry_id)
+    restored = await snapshot.async_load()
+
+    # Follow the boiler switch so interval on-times don't need recorder scans
+    tracker = BoilerOnTimeTracker(hass, entry_id, boiler_entity, snapshot)
+    await tracker.async_start(restored.get("boiler_on_time"))
+
+    # Runtime data of this meter; nothing here is shared with other entries
+    entry_data = hass.data.setdefault(DOMAIN, {}).setdefault(entry_id, {})
+    entry_data.update(
+        snapshot=snapshot,
+        boiler_entity=boiler_entity,
+        boiler_tracker=tracker,
+        average_m3_per_min=boiler_av_min,
+        latest_gas_data=latest_gas_data,
+        latest_gas_update=now,
+    )
+    meter = restored.get("meter")
+    if meter is not None:
+        entry_data.update(meter, latest_gas_update=dt_util.parse_datetime(meter["latest_gas_update"]))
+        if entry_data["rate_fit"] is None:
+            entry_data.pop("rate_fit")
+    snapshot.register("meter", lambda: _meter_snapshot(entry_data))
+
+    # Hourly/daily/monthly consumption buckets, kept up to date by readings and the boiler
+    rollups = ConsumptionRollups(hass, entry_id, tracker, snapshot)
+    rollups_restored = await rollups.async_start(restored.get("rollups"))
+    entry_data["rollups"] = rollups
+    # Day/week/billing period projections from the rollups' on-time history
+    forecaster = ConsumptionForecaster(hass, entry_id, rollups, tracker)
+    forecaster.async_start()
+    entry_data["forecaster"] = forecaster
+    _async_start_updates(hass, config_entry)
+    entry_data["write_queue"] = WriteQueue(
+        hass, entry_id, lambda readings: _async_apply_readings(hass, entry_id, readings)
+    )
 
     await hass.config_entries.async_forward_entry_setups(config_entry, ["sensor"])
-    return True
+    config_entry.async_on_unload(config_entry.add_update_listener(_async_options_updated))
 
+    # The record log is only needed to reconcile; read it after setup, as a queued job
+    config_entry.async_create_background_task(
+        hass,
+        entry_data["write_queue"].async_run(lambda: _async_reconcile(hass, entry_id, meter, rollups_restored)),
+        f"{DOMAIN} reconcile {entry_id}",
+    )
+    return True
 
 async def async_unload_entry(hass: HomeAssistant, config_entry: ConfigEntry):
-    """Unload the integration."""
-    await hass.config_entries.async_forward_entry_unload(config_entry, "sensor")
+    """Unload a gas meter and write its snapshot."""
+    if not await hass.config_entries.async_unload_platforms(config_entry, ["sensor"]):
+        return False
+    entry_data = hass.data[DOMAIN].pop(config_entry.entry_id)
+    entry_data["updates"].async_stop()
+    entry_data["forecaster"].async_stop()
+    entry_data["rollups"].async_stop()
+    entry_data["boiler_tracker"].async_stop()
+    await entry_data["snapshot"].async_save()
     return True
+
+@callback
+def _async_start_updates(hass: HomeAssistant, config_entry: ConfigEntry):
+    """(Re)creates the meter's UpdateDispatcher with the current options."""
+    entry_data = hass.data[DOMAIN][config_entry.entry_id]
+    if "updates" in entry_data:
+        entry_data["updates"].async_stop()
+    updates = UpdateDispatcher(
+        hass,
+        config_entry.entry_id,
+        entry_data["boiler_tracker"],
+        config_entry.options.get(CONF_UPDATE_DEBOUNCE, DEFAULT_UPDATE_DEBOUNCE),
+        config_entry.options.get(CONF_REFRESH_INTERVAL, DEFAULT_REFRESH_INTERVAL),
+    )
+    updates.async_start()
+    entry_data["updates"] = updates
+
+async def _async_options_updated(hass: HomeAssistant, config_entry: ConfigEntry):
+    """Apply changed options right away instead of at the next reading."""
+    _async_start_updates(hass, config_entry)
+    gas_consume = await fh.async_get_gas_consume(hass, config_entry.entry_id)
+    _update_latest(hass, config_entry.entry_id, gas_consume)
+    hass.data[DOMAIN][config_entry.entry_id]["updates"].async_schedule()
@@ -0,0 +1,263 @@
+import logging
+from bisect import bisect_right
+from homeassistant.const import STATE_ON
+from homeassistant.core import HomeAssistant, Event, callback
+from homeassistant.components.recorder import get_instance
+from homeassistant.components.recorder.history import get_significant_states
+from homeassistant.helpers.event import async_track_state_change_event
+from homeassistant.helpers.storage import Store
+from homeassistant.util import dt as dt_util
+from .const import DOMAIN
+from .instrumentation import COUNTER_RECORDER_ROWS, TIMING_RECORDER, MeterMetrics, get_metrics
+
+_LOGGER = logging.getLogger(__name__)
+
+# Checkpoints used to have a store of their own; they are now part of the meter snapshot
+LEGACY_STORAGE_VERSION = 1
+LEGACY_STORAGE_KEY = f"{DOMAIN}.boiler_on_time"
+
+
+async def _async_significant_states(hass: HomeAssistant, entity_id, start_time, end_time, metrics):
+    with metrics.timer(TIMING_RECORDER):
+        history_list = await get_instance(hass).async_add_executor_job(
+            get_significant_states, hass, start_time, end_time, [entity_id]
+        )
+    states = history_list.get(entity_id, [])
+    metrics.count(COUNTER_RECORDER_ROWS, len(states))
+    return states
+
+async def async_recorder_transitions(hass: HomeAssistant, entity_id, start_time, end_time, metrics=None):
+    """(UTC epoch, is on) of entity_id's states between start_time and end_time, starting with the state at start_time."""
+    states = await _async_significant_states(hass, entity_id, start_time, end_time, metrics or MeterMetrics())
+    start = start_time.timestamp()
+    return [(max(state.last_changed.timestamp(), start), state.state == STATE_ON) for state in states]
+
+
+async def async_recorder_on_seconds_for_ranges(hass: HomeAssistant, entity_id, ranges, metrics=None):
+    """
+    On-seconds of entity_id for each (start, end) UTC epoch range, using a single recorder
+    query covering all of them and one sweep over the returned states.
+    """
+    if not ranges:
+        return []
+    start_time = dt_util.utc_from_timestamp(min(start for start, _end in ranges))
+    end_time = dt_util.utc_from_timestamp(max(end for _start, end in ranges))
+    states = await _async_significant_states(hass, entity_id, start_time, end_time, metrics or MeterMetrics())
+    times = [start_time.timestamp()]
+    cumulated = [0.0]
+    is_on = [False]
+    for state in states:
+        timestamp = max(state.last_changed.timestamp(), times[-1])
+        cumulated.append(cumulated[-1] + (timestamp - times[-1] if is_on[-1] else 0.0))
+        times.append(timestamp)
+        is_on.append(state.state == STATE_ON)
+
+    def cumulated_at(timestamp):
+        index = bisect_right(times, timestamp) - 1
+        return cumulated[index] + (timestamp - times[index] if is_on[index] else 0.0)
+
+    return [cumulated_at(end) - cumulated_at(start) for start, end in ranges]
+
+
+# Keeps a running "on" seconds counter for the boiler switch.
+# Every on/off transition is stored with the counter value at that moment, so the
+# on-time between any two observed instants is a difference of two bisect lookups.
+# Time HA didn't observe (before tracking started, or while it was down) is
+# reported as gaps and filled from the recorder.
+class BoilerOnTimeTracker:
+
+    def __init__(self, hass: HomeAssistant, entry_id, entity_id, snapshot):
+        self.hass = hass
+        self.entity_id = entity_id
+        self._times = []
+        self._cumulated = []
+        self._is_on = []
+        self._gaps = []
+        self._snapshot = snapshot
+        self._metrics = get_metrics(hass, entry_id)
+        self._legacy_store = Store(hass, LEGACY_STORAGE_VERSION, f"{LEGACY_STORAGE_KEY}.{entry_id}")
+        snapshot.register("boiler_on_time", self._checkpoint_data)
+        self._unsub = None
+        self._listeners = []
+
+    @property
+    def is_on(self):
+        return bool(self._is_on) and self._is_on[-1]
+
+    @property
+    def stats(self):
+        """Size of the in-memory transition history."""
+        return {"entity_id": self.entity_id, "is_on": self.is_on, "transitions": len(self._times), "gaps": len(self._gaps)}
+
+    def _append(self, timestamp, is_on):
+        if self._times:
+            timestamp = max(timestamp, self._times[-1])
+            cumulated = self._cumulated_at(timestamp)
+        else:
+            cumulated = 0.0
+        self._times.append(timestamp)
+        self._cumulated.append(cumulated)
+        self._is_on.append(is_on)
+
+    def _cumulated_at(self, timestamp):
+        index = bisect_right(self._times, timestamp) - 1
+        if index < 0:
+            return 0.0
+        if self._is_on[index]:
+            return self._cumulated[index] + timestamp - self._times[index]
+        return self._cumulated[index]
+
+    async def async_start(self, data):
+        """Restores the checkpoint from the snapshot part `data` and starts following the boiler switch."""
+        now = dt_util.utcnow().timestamp()
+        if data is None:
+            data = await self._legacy_store.async_load()
+            if data is not None:
+                await self._legacy_store.async_remove()
+        if data and data.get("entity_id") == self.entity_id and data["times"]:
+            self._times = data["times"]
+            self._cumulated = data["cumulated"]
+            self._is_on = data["is_on"]
+            self._gaps = [tuple(gap) for gap in data["gaps"]]
+            # Nothing is known between the checkpoint and now: close the observed
+            # range as "off" and leave the rest to the recorder.
+            saved_at = min(data["saved_at"], now)
+            self._append(saved_at, False)
+            if saved_at < now:
+                self._gaps.append((saved_at, now))
+
+        state = self.hass.states.get(self.entity_id)
+        self._append(now, state is not None and state.state == STATE_ON)
+        self._unsub = async_track_state_change_event(
+            self.hass, [self.entity_id], self._handle_state_change
+        )
+        self._schedule_checkpoint()
+
+    @callback
+    def async_stop(self):
+        if self._unsub:
+            self._unsub()
+            self._unsub = None
+
+    @callback
+    def async_add_listener(self, update_callback):
+        """Calls update_callback on every on/off transition. Returns a remove function."""
+        self._listeners.append(update_callback)
+        return lambda: self._listeners.remove(update_callback)
+
+    @callback
+    def _handle_state_change(self, event: Event):
+        new_state = event.data.get("new_state")
+        is_on = new_state is not None and new_state.state == STATE_ON
+        if is_on == self.is_on:
+            return
+        timestamp = new_state.last_changed.timestamp() if new_state else dt_util.utcnow().timestamp()
+        self._append(timestamp, is_on)
+        self._schedule_checkpoint()
+        for update_callback in list(self._listeners):
+            update_callback()
+
+    def _checkpoint_data(self):
+        return {
+            "entity_id": self.entity_id,
+            "saved_at": dt_util.utcnow().timestamp(),
+            "times": self._times,
+            "cumulated": self._cumulated,
+            "is_on": self._is_on,
+            "gaps": self._gaps,
+        }
+
+    @callback
+    def _schedule_checkpoint(self):
+        self._snapshot.async_schedule_save()
+
+    @callback
+    def prune(self, before):
+        """Forgets transitions no longer needed for intervals starting at or after `before`."""
+        timestamp = dt_util.as_utc(before).timestamp()
+        index = bisect_right(self._times, timestamp) - 1
+        if index > 0:
+            del self._times[:index]
+            del self._cumulated[:index]
+            del self._is_on[:index]
+        self._gaps = [gap for gap in self._gaps if gap[1] > timestamp]
+        self._schedule_checkpoint()
+
+    async def async_fill_gaps(self, since):
+        """
+        Replaces the unobserved time after `since` (the latest reading) with the boiler's
+        recorded states, so the live estimates count it without a recorder query of their
+        own. Called after startup and when the latest reading is deleted; earlier gaps are
+        still filled per interval.
+        """
+        since = dt_util.as_utc(since).timestamp()
+        ranges = [(max(start, since), end) for start, end in self._gaps if end > since]
+        if self._times and since < self._times[0]:
+            ranges.append((since, self._times[0]))
+        if not ranges:
+            return
+        start_time = dt_util.utc_from_timestamp(min(start for start, _end in ranges))
+        end_time = dt_util.utc_from_timestamp(max(end for _start, end in ranges))
+        _LOGGER.debug("Filling %d boiler on-time gaps since %s from the recorder", len(ranges), start_time)
+        recorded = await async_recorder_transitions(self.hass, self.entity_id, start_time, end_time, self._metrics)
+        recorded_times = [timestamp for timestamp, _is_on in recorded]
+
+        transitions = list(zip(self._times, self._is_on))
+        for start, end in ranges:
+            # The state at the start of the gap, then every change until its end
+            first = max(bisect_right(recorded_times, start) - 1, 0)
+            transitions = [transition for transition in transitions if not start <= transition[0] < end]
+            # Without recorded states the boiler counts as off
+            transitions.extend(
+                [(max(timestamp, start), is_on) for timestamp, is_on in recorded[first:] if timestamp < end]
+                or [(start, False)]
+            )
+        transitions.sort(key=lambda transition: transition[0])
+
+        self._times, self._cumulated, self._is_on = [], [], []
+        for timestamp, is_on in transitions:
+            self._append(timestamp, is_on)
+        self._gaps = [(start, min(end, since)) for start, end in self._gaps if start < since]
+        self._schedule_checkpoint()
+
+    def on_seconds_observed(self, start_time, end_time):
+        """
+        Seconds "on" between start_time and end_time using only observed transitions,
+        together with the sub-ranges that still have to be filled from the recorder.
+        """
+        start = dt_util.as_utc(start_time).timestamp()
+        end = dt_util.as_utc(end_time).timestamp()
+        if end <= start:
+            return 0.0, []
+
+        missing = []
+        observed_from = self._times[0] if self._times else end
+        if start < observed_from:
+            missing.append((start, min(end, observed_from)))
+        for gap_start, gap_end in self._gaps:
+            if gap_start < end and gap_end > start:
+                missing.append((max(gap_start, start), min(gap_end, end)))
+
+        observed_start = max(start, observed_from)
+        total = 0.0
+        if end > observed_start:
+            total = self._cumulated_at(end) - self._cumulated_at(observed_start)
+        return total, missing
+
+    async def async_on_seconds_for_intervals(self, intervals):
+        """
+        Seconds "on" for each (start_time, end_time) interval. All parts not observed by
+        the tracker are filled from a single recorder query.
+        """
+        totals = []
+        missing = []
+        for start_time, end_time in intervals:
+            total, interval_missing = self.on_seconds_observed(start_time, end_time)
+            totals.append(total)
+            missing.extend((len(totals) - 1, gap) for gap in interval_missing)
+        filled = await async_recorder_on_seconds_for_ranges(
+            self.hass, self.entity_id, [gap for _index, gap in missing], self._metrics
+        )
+        for (index, _gap), seconds in zip(missing, filled):
+            totals[index] += seconds
+        return totals
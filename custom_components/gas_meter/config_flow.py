@@ -1,20 +1,37 @@
 from homeassistant import config_entries
+from homeassistant.core import callback
 import voluptuous as vol
 from homeassistant.helpers import entity_registry as er
-from .const import DOMAIN, CONF_BOILER_ENTITY, CONF_BOILER_AVERAGE, CONF_LATEST_GAS_DATA, DEFAULT_BOILER_AV_H, DEFAULT_LATEST_GAS_DATA
+from .const import (
+    DOMAIN, CONF_BOILER_ENTITY, CONF_BOILER_AVERAGE, CONF_LATEST_GAS_DATA, DEFAULT_BOILER_AV_H, DEFAULT_LATEST_GAS_DATA,
+    CONF_RECORDS_WINDOW, CONF_RECORDS_DAYS, DEFAULT_RECORDS_WINDOW, DEFAULT_RECORDS_DAYS,
+    CONF_RATE_MODEL, CONF_RATE_HALF_LIFE, DEFAULT_RATE_MODEL, DEFAULT_RATE_HALF_LIFE,
+    CONF_REFRESH_INTERVAL, DEFAULT_REFRESH_INTERVAL, CONF_UPDATE_DEBOUNCE, DEFAULT_UPDATE_DEBOUNCE,
+    CONF_BILLING_DAY, DEFAULT_BILLING_DAY
+)
+from .rate_model import RATE_MODELS
 
 class GasMeterConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
     """Handle a config flow for the Virtual Gas Meter integration."""
 
     VERSION = 1
 
+    @staticmethod
+    @callback
+    def async_get_options_flow(config_entry):
+        """Get the options flow for this handler."""
+        return GasMeterOptionsFlow()
+
     async def async_step_user(self, user_input=None):
         """Handle the user input step."""
         errors = {}
 
         if user_input is not None:
+            # One entry per boiler; several meters can be set up side by side
+            await self.async_set_unique_id(user_input[CONF_BOILER_ENTITY])
+            self._abort_if_unique_id_configured()
             return self.async_create_entry(
-                title="Virtual Gas Meter",
+                title=f"Virtual Gas Meter ({user_input[CONF_BOILER_ENTITY]})",
                 data=user_input,
             )
 
@@ -44,3 +61,39 @@ class GasMeterConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             entity.entity_id for entity in entity_registry.entities.values()
             if entity.entity_id.startswith("switch.")
         ]
+
+
+class GasMeterOptionsFlow(config_entries.OptionsFlow):
+    """Handle options of the Virtual Gas Meter integration."""
+
+    async def async_step_init(self, user_input=None):
+        """Manage the options."""
+        if user_input is not None:
+            return self.async_create_entry(title="", data=user_input)
+
+        options = self.config_entry.options
+        schema = vol.Schema({
+            vol.Optional(
+                CONF_RECORDS_WINDOW, default=options.get(CONF_RECORDS_WINDOW, DEFAULT_RECORDS_WINDOW)
+            ): vol.All(vol.Coerce(int), vol.Range(min=1)),
+            vol.Optional(
+                CONF_RECORDS_DAYS, default=options.get(CONF_RECORDS_DAYS, DEFAULT_RECORDS_DAYS)
+            ): vol.All(vol.Coerce(int), vol.Range(min=0)),
+            vol.Optional(
+                CONF_RATE_MODEL, default=options.get(CONF_RATE_MODEL, DEFAULT_RATE_MODEL)
+            ): vol.In(RATE_MODELS),
+            vol.Optional(
+                CONF_RATE_HALF_LIFE, default=options.get(CONF_RATE_HALF_LIFE, DEFAULT_RATE_HALF_LIFE)
+            ): vol.All(vol.Coerce(float), vol.Range(min=0.1)),
+            vol.Optional(
+                CONF_REFRESH_INTERVAL, default=options.get(CONF_REFRESH_INTERVAL, DEFAULT_REFRESH_INTERVAL)
+            ): vol.All(vol.Coerce(int), vol.Range(min=5)),
+            vol.Optional(
+                CONF_UPDATE_DEBOUNCE, default=options.get(CONF_UPDATE_DEBOUNCE, DEFAULT_UPDATE_DEBOUNCE)
+            ): vol.All(vol.Coerce(float), vol.Range(min=0)),
+            vol.Optional(
+                CONF_BILLING_DAY, default=options.get(CONF_BILLING_DAY, DEFAULT_BILLING_DAY)
+            ): vol.All(vol.Coerce(int), vol.Range(min=1, max=28)),
+        })
+
+        return self.async_show_form(step_id="init", data_schema=schema)
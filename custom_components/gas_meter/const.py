@@ -4,7 +4,40 @@ DOMAIN = "gas_meter"
 CONF_BOILER_ENTITY = "boiler_entity"
 CONF_BOILER_AVERAGE = "boiler_average"
 CONF_LATEST_GAS_DATA = "latest_gas_data"
+CONF_ENTRY_ID = "entry_id"
+CONF_RECORDS_WINDOW = "records_window"
+CONF_RECORDS_DAYS = "records_days"
+CONF_RATE_MODEL = "rate_model"
+CONF_RATE_HALF_LIFE = "rate_half_life_days"
+CONF_REFRESH_INTERVAL = "refresh_interval"
+CONF_UPDATE_DEBOUNCE = "update_debounce"
+CONF_BILLING_DAY = "billing_day"
 DEFAULT_BOILER_AV_H = 0.64153071524727
 DEFAULT_BOILER_AV_M = DEFAULT_BOILER_AV_H / 60
 DEFAULT_LATEST_GAS_DATA = 0
 DEFAULT_BOILER_ENTITY = "switch.kociol_l1"
+# How many of the latest records GasDataSensor exposes as attributes (0 days = no age limit)
+DEFAULT_RECORDS_WINDOW = 50
+DEFAULT_RECORDS_DAYS = 0
+# Page size limits of the get_records service
+DEFAULT_RECORDS_PAGE = 100
+MAX_RECORDS_PAGE = 1000
+# Rate model feeding average_m3_per_min ("cumulative" = rate of the latest record, see rate_model)
+DEFAULT_RATE_MODEL = "cumulative"
+DEFAULT_RATE_HALF_LIFE = 30
+# How often (seconds) the live estimates are written while the boiler is on, and how long
+# (seconds) changes are collected into one batch of state writes
+DEFAULT_REFRESH_INTERVAL = 60
+DEFAULT_UPDATE_DEBOUNCE = 1.0
+# Day of the month billing periods start on (the forecast projects the current period)
+DEFAULT_BILLING_DAY = 1
+# Directories (under the config directory) import_readings reads from and export_records writes to
+IMPORT_DIRECTORY = "gas_meter_import"
+EXPORT_DIRECTORY = "gas_meter_export"
+
+# Dispatcher signal sent (in batches, see update_dispatcher) whenever the latest reading,
+# the average rate or the boiler state of a meter changes
+SIGNAL_GAS_DATA_UPDATED = f"{DOMAIN}_gas_data_updated"
+
+def signal_gas_data_updated(entry_id):
+    return f"{SIGNAL_GAS_DATA_UPDATED}_{entry_id}"
@@ -7,5 +7,8 @@ def string_to_datetime(datetime_string):
         try:
             gas_datetime = datetime.strptime(datetime_string, "%Y-%m-%d %H:%M:%S")
         except ValueError:
-            gas_datetime = datetime.strptime(datetime_string, "%Y-%m-%d %H:%M")
+            try:
+                gas_datetime = datetime.strptime(datetime_string, "%Y-%m-%d %H:%M")
+            except ValueError:
+                gas_datetime = datetime.fromisoformat(datetime_string)
     return gas_datetime
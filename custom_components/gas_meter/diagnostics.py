@@ -0,0 +1,37 @@
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+import custom_components.gas_meter.file_handler as fh
+from .const import DOMAIN
+
+
+async def async_get_config_entry_diagnostics(hass: HomeAssistant, config_entry: ConfigEntry):
+    """Metrics and component statistics of one gas meter for the diagnostics download."""
+    entry_data = hass.data[DOMAIN][config_entry.entry_id]
+    # Only the cached copy; downloading diagnostics never loads the log
+    gas_consume = entry_data.get("gas_consume")
+    signature = entry_data.get("gas_consume_signature")
+    latest_gas_update = entry_data.get("latest_gas_update")
+    return {
+        "entry": {
+            "title": config_entry.title,
+            "data": dict(config_entry.data),
+            "options": dict(config_entry.options),
+        },
+        "log": {
+            "path": str(fh.get_gas_log_path(hass, config_entry.entry_id)),
+            "bytes": signature[1] if signature else None,
+            "records": len(gas_consume) if gas_consume is not None else None,
+            "frames": gas_consume.log_frames if gas_consume is not None else None,
+        },
+        "meter": {
+            "latest_gas_data": entry_data.get("latest_gas_data"),
+            "latest_gas_update": latest_gas_update.isoformat() if latest_gas_update else None,
+            "average_m3_per_min": entry_data.get("average_m3_per_min"),
+            "rate_fit": entry_data.get("rate_fit"),
+        },
+        "metrics": entry_data["metrics"].as_dict(),
+        "write_queue": entry_data["write_queue"].stats,
+        "updates": entry_data["updates"].stats,
+        "boiler_tracker": entry_data["boiler_tracker"].stats,
+        "forecast": entry_data["forecaster"].stats,
+    }
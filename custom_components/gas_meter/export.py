@@ -0,0 +1,115 @@
+import json
+import math
+import os
+import zipfile
+from pathlib import Path
+import numpy as np
+from numpy.lib import format as npy_format
+from homeassistant.util import dt as dt_util
+from .const import EXPORT_DIRECTORY
+from .gas_consume import FIELDS, from_timestamp
+
+EXPORT_CSV = "csv"
+EXPORT_JSONL = "jsonl"
+EXPORT_NPZ = "npz"
+EXPORT_FORMATS = (EXPORT_CSV, EXPORT_JSONL, EXPORT_NPZ)
+
+# Records are read, converted and written this many at a time, so the memory an export
+# needs doesn't grow with the history.
+CHUNK_SIZE = 10_000
+
+# Derived per record from the record before it (NaN for the very first record)
+INTERVAL_COLUMNS = ("interval_minutes", "interval_consumed_gas")
+# The text formats start with the local ISO time and consumed_gas (like import_readings
+# files); the npz archive holds the UTC epoch instead
+COLUMNS = ("datetime", *FIELDS, *INTERVAL_COLUMNS)
+NPZ_COLUMNS = ("timestamp", *COLUMNS[1:])
+
+
+def default_export_path(hass, entry_id, export_format):
+    """gas_meter_export/<entry_id>_<local time>.<format> in the config directory."""
+    stamp = dt_util.now().strftime("%Y%m%d_%H%M%S")
+    return Path(hass.config.path(EXPORT_DIRECTORY, f"{entry_id}_{stamp}.{export_format}"))
+
+
+def _column_chunk(gas_consume, name, start, stop):
+    """Values of one export column for the records start..stop-1 (a NumPy copy)."""
+    if name == "timestamp":
+        return np.array(gas_consume.timestamps[start:stop])
+    if name in FIELDS:
+        return np.array(gas_consume.column(name)[start:stop])
+    # Interval columns also need the record before the chunk
+    source = gas_consume.column("min_cumulated" if name == "interval_minutes" else "consumed_gas")
+    values = np.array(source[max(start - 1, 0):stop])
+    if name == "interval_minutes":
+        # Cumulative minutes are missing for records that were never measured
+        values = np.fmax.accumulate(np.nan_to_num(values, nan=0.0))
+    intervals = np.diff(values)
+    return intervals if start > 0 else np.concatenate(([math.nan], intervals))
+
+
+def _chunks(start, stop):
+    for chunk_start in range(start, stop, CHUNK_SIZE):
+        yield chunk_start, min(chunk_start + CHUNK_SIZE, stop)
+
+
+def _write_text(file, gas_consume, start, stop, line, datetime_format, missing):
+    """
+    Writes one `line` (a %-template with one slot per column) per record. Values are
+    converted column-wise per chunk; floats keep their exact repr, NaN becomes `missing`.
+    """
+    for chunk_start, chunk_stop in _chunks(start, stop):
+        values = [_column_chunk(gas_consume, name, chunk_start, chunk_stop).tolist() for name in NPZ_COLUMNS]
+        columns = [[datetime_format % from_timestamp(timestamp).isoformat() for timestamp in values[0]]]
+        columns.extend([missing if value != value else repr(value) for value in column] for column in values[1:])
+        file.write("".join(line % row for row in zip(*columns)))
+
+
+def _write_csv(file, gas_consume, start, stop):
+    # Numbers and ISO datetimes never need quoting
+    file.write(",".join(COLUMNS) + "\n")
+    _write_text(file, gas_consume, start, stop, ",".join(["%s"] * len(COLUMNS)) + "\n", "%s", "")
+
+
+def _write_jsonl(file, gas_consume, start, stop):
+    line = "{" + ", ".join(f"{json.dumps(name)}: %s" for name in COLUMNS) + "}\n"
+    _write_text(file, gas_consume, start, stop, line, '"%s"', "null")
+
+
+def _write_npz(path, gas_consume, start, stop):
+    """One float64 .npy member per column, each written chunk by chunk."""
+    with zipfile.ZipFile(path, "x", compression=zipfile.ZIP_STORED, allowZip64=True) as archive:
+        for name in NPZ_COLUMNS:
+            with archive.open(f"{name}.npy", "w", force_zip64=True) as member:
+                npy_format.write_array_header_1_0(
+                    member, {"descr": "<f8", "fortran_order": False, "shape": (stop - start,)}
+                )
+                for chunk_start, chunk_stop in _chunks(start, stop):
+                    member.write(_column_chunk(gas_consume, name, chunk_start, chunk_stop).astype("<f8").tobytes())
+
+
+def export_records(gas_consume, path, export_format, start=None, end=None):
+    """
+    Writes the records with start <= datetime <= end (None = open end) and their interval
+    columns to `path`, which must not exist yet (FileExistsError). The file is written
+    next to its final name and then linked there, so an existing file is never replaced.
+    Returns the number of exported records.
+    """
+    if path.exists():
+        raise FileExistsError(f"{path} already exists")
+    indices = gas_consume.index_range(start, end)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Opened exclusively ("x") as well, so no file is ever truncated
+    tmp_path = path.with_name(f".{path.name}.{os.urandom(4).hex()}.tmp")
+    try:
+        if export_format == EXPORT_NPZ:
+            _write_npz(tmp_path, gas_consume, indices.start, indices.stop)
+        else:
+            write = _write_csv if export_format == EXPORT_CSV else _write_jsonl
+            with open(tmp_path, "x", newline="", encoding="utf-8") as file:
+                write(file, gas_consume, indices.start, indices.stop)
+        # Unlike os.replace, fails if the file appeared meanwhile
+        os.link(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    return len(indices)
@@ -1,29 +1,281 @@
+import asyncio
+import csv
+import itertools
+import json
+import logging
+import os
 from pathlib import Path
 from .datetime_handler import string_to_datetime
-import pickle
 from .gas_consume import GasConsume
-import aiofiles
+from .record_format import encode_frames, legacy_loads, read_legacy_log, read_log, write_base
+from .const import DOMAIN
+from .instrumentation import COUNTER_BYTES_READ, COUNTER_BYTES_WRITTEN, TIMING_LOAD, TIMING_SAVE, get_metrics
+
+_LOGGER = logging.getLogger(__name__)
+
+# Records are kept in a binary log (see record_format): a columnar base followed by
+# checksummed journal frames. Saving appends frames for the changed records only; a
+# torn frame at the end (e.g. power loss mid-write) is cut off on the next load.
+
+# The log is rewritten (compacted) into a new base once its journal holds more than
+# 1/COMPACT_RATIO as many frames as there are records (and at least COMPACT_MIN_FRAMES).
+COMPACT_RATIO = 32
+COMPACT_MIN_FRAMES = 64
 
 def get_gas_actualdata_path(hass):
-    """Returns the path to the gas consumption data file."""
+    """Returns the path to the legacy (pickled) gas consumption data file."""
     return Path(hass.config.path("custom_components/gas_meter/gas_actualdata.pkl"))
 
-async def save_gas_actualdata(gas_consume, hass):
-    """Saves the gas consumption data to a file asynchronously."""
-    filename = get_gas_actualdata_path(hass)
-    async with aiofiles.open(filename, "wb") as file:
-        await file.write(pickle.dumps(gas_consume))
+def get_legacy_log_path(hass):
+    """Returns the path to the record log used before per-entry logs."""
+    return Path(hass.config.path("custom_components/gas_meter/gas_actualdata.log"))
+
+def get_pickle_log_path(hass, entry_id):
+    """Returns the path to the per-entry record log used before the binary format."""
+    return Path(hass.config.path(f"custom_components/gas_meter/gas_actualdata_{entry_id}.log"))
+
+def get_gas_log_path(hass, entry_id):
+    """Returns the path to the binary gas consumption record log of a config entry."""
+    return Path(hass.config.path(f"custom_components/gas_meter/gas_actualdata_{entry_id}.bin"))
+
+def _fsync_dir(path):
+    """Make a rename/creation in the directory durable (no-op where unsupported)."""
+    try:
+        fd = os.open(path.parent, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def _append_frames(path, data):
+    with open(path, "ab") as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    return len(data)
+
+def _write_compacted(path, gas_consume):
+    """Atomically replaces the log with a base holding all records. Returns the bytes written."""
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp_path, "wb") as file:
+        written = write_base(file, gas_consume)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+    _fsync_dir(path)
+    return written
+
+def _needs_compaction(frames, records):
+    return frames >= COMPACT_MIN_FRAMES and frames * COMPACT_RATIO > records
+
+def _save_sync(gas_consume, path):
+    """Writes the changes since the last load/save; returns the bytes written."""
+    new_frames = len(gas_consume.deleted) + len(gas_consume) - gas_consume.persisted
+    frames = gas_consume.log_frames + new_frames
+    written = 0
+    if not path.exists() or _needs_compaction(frames, len(gas_consume)):
+        written = _write_compacted(path, gas_consume)
+        frames = 0
+    elif new_frames:
+        written = _append_frames(path, encode_frames(gas_consume, gas_consume.deleted, gas_consume.persisted))
+    gas_consume.persisted = len(gas_consume)
+    gas_consume.log_frames = frames
+    gas_consume.deleted = []
+    return written
+
+def _load_sync(path):
+    with open(path, "rb") as file:
+        timestamps, columns, fields, frames, size = read_log(file)
+        file_size = file.tell()
+    if size != file_size:
+        _LOGGER.warning("Truncating %d corrupted trailing bytes of %s", file_size - size, path)
+        with open(path, "r+b") as file:
+            file.truncate(size)
+            file.flush()
+            os.fsync(file.fileno())
+    gas_consume = GasConsume.from_columns(timestamps, columns)
+    # A log lacking fields (written by an older version) is rewritten with them. Fields only
+    # a newer version knows are kept as they are, so the log is not rewritten for them.
+    if gas_consume.fields != fields or _needs_compaction(frames, len(gas_consume)):
+        if gas_consume.fields != fields:
+            _LOGGER.info("Migrating %s from fields %s to %s", path, fields, gas_consume.fields)
+        _write_compacted(path, gas_consume)
+        frames = 0
+    gas_consume.persisted = len(gas_consume)
+    gas_consume.log_frames = frames
+    return gas_consume
+
+def _claim_legacy_log(legacy_path, path):
+    """Moves the single pre-multi-meter log to `path`; only the first entry gets it."""
+    if path.exists():
+        return False
+    try:
+        os.rename(legacy_path, path)
+    except FileNotFoundError:
+        return False
+    _fsync_dir(path)
+    return True
+
+def _migrate_pickle_log(pickle_log_path, path):
+    """Rewrites a pickled-frame log in the binary format and keeps it as *.log.migrated."""
+    try:
+        with open(pickle_log_path, "rb") as file:
+            data = file.read()
+    except FileNotFoundError:
+        return None
+    gas_consume = GasConsume(read_legacy_log(data))
+    _write_compacted(path, gas_consume)
+    os.replace(pickle_log_path, pickle_log_path.with_suffix(".log.migrated"))
+    return len(gas_consume)
+
+def _migrate_pickle_file(legacy_path, path):
+    """Rewrites the whole-file pickle in the binary format and keeps it as *.pkl.migrated."""
+    try:
+        with open(legacy_path, "rb") as file:
+            data = file.read()
+    except FileNotFoundError:
+        return None
+    gas_consume = legacy_loads(data)
+    _write_compacted(path, gas_consume)
+    os.replace(legacy_path, legacy_path.with_suffix(".pkl.migrated"))
+    return len(gas_consume)
+
+async def _migrate_legacy_data(hass, entry_id, path):
+    """
+    One-time migration of the former data files into the binary record log: the
+    per-entry pickled log, the single-meter log or the whole-file pickle.
+    """
+    pickle_log_path = get_pickle_log_path(hass, entry_id)
+    if await hass.async_add_executor_job(_claim_legacy_log, get_legacy_log_path(hass), pickle_log_path):
+        _LOGGER.info("Moved %s to %s", get_legacy_log_path(hass), pickle_log_path)
+    migrated = await hass.async_add_executor_job(_migrate_pickle_log, pickle_log_path, path)
+    if migrated is not None:
+        _LOGGER.info("Migrated %d gas records from %s to %s", migrated, pickle_log_path, path)
+        return True
+
+    legacy_path = get_gas_actualdata_path(hass)
+    migrated = await hass.async_add_executor_job(_migrate_pickle_file, legacy_path, path)
+    if migrated is None:
+        return False
+    _LOGGER.info("Migrated %d gas records from %s to %s", migrated, legacy_path, path)
+    return True
 
-async def load_gas_actualdata(hass):
+async def save_gas_actualdata(gas_consume, hass, entry_id):
     """
-    Loads gas consumption data from a file asynchronously.
-    If the file does not exist, returns a new GasConsume object.
+    Saves the gas consumption data asynchronously.
+    Only records added since the last load/save are appended to the log.
+    Returns the number of bytes written.
     """
-    filename = get_gas_actualdata_path(hass)
+    return await hass.async_add_executor_job(_save_sync, gas_consume, get_gas_log_path(hass, entry_id))
+
+async def load_gas_actualdata(hass, entry_id):
+    """
+    Loads gas consumption data from the record log asynchronously.
+    If no log exists yet, the data of the former formats or single-meter setup is migrated first.
+    If neither file exists, returns a new GasConsume object.
+    """
+    path = get_gas_log_path(hass, entry_id)
+    if not await hass.async_add_executor_job(path.exists) and not await _migrate_legacy_data(hass, entry_id, path):
+        return GasConsume()
+    return await hass.async_add_executor_job(_load_sync, path)
+
+def _stat_signature(path):
     try:
-        async with aiofiles.open(filename, "rb") as file:
-            data = await file.read()
-            return pickle.loads(data)
+        stat = os.stat(path)
     except FileNotFoundError:
-        gas_consume = GasConsume()
-        return gas_consume
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+def _get_cache(hass, entry_id):
+    entry_data = hass.data.setdefault(DOMAIN, {}).setdefault(entry_id, {})
+    if "gas_consume_lock" not in entry_data:
+        entry_data["gas_consume_lock"] = asyncio.Lock()
+        entry_data["gas_consume"] = None
+        entry_data["gas_consume_signature"] = None
+    return entry_data
+
+async def async_get_gas_consume(hass, entry_id):
+    """
+    Returns the GasConsume instance of a config entry, shared by services and sensors.
+    It is loaded lazily and re-read only when the log's mtime or size changed
+    behind our back (e.g. the file was replaced or edited externally).
+    """
+    cache = _get_cache(hass, entry_id)
+    path = get_gas_log_path(hass, entry_id)
+    async with cache["gas_consume_lock"]:
+        signature = await hass.async_add_executor_job(_stat_signature, path)
+        if cache["gas_consume"] is None or signature != cache["gas_consume_signature"]:
+            metrics = get_metrics(hass, entry_id)
+            with metrics.timer(TIMING_LOAD):
+                cache["gas_consume"] = await load_gas_actualdata(hass, entry_id)
+            cache["gas_consume_signature"] = await hass.async_add_executor_job(_stat_signature, path)
+            if cache["gas_consume_signature"]:
+                metrics.count(COUNTER_BYTES_READ, cache["gas_consume_signature"][1])
+        return cache["gas_consume"]
+
+def invalidate_gas_consume(hass, entry_id):
+    """Drops the shared GasConsume so the next access reloads it from disk."""
+    _get_cache(hass, entry_id)["gas_consume"] = None
+
+async def async_save_gas_consume(hass, entry_id, gas_consume):
+    """Writes the shared GasConsume through to disk and keeps the cache valid."""
+    cache = _get_cache(hass, entry_id)
+    async with cache["gas_consume_lock"]:
+        metrics = get_metrics(hass, entry_id)
+        try:
+            with metrics.timer(TIMING_SAVE):
+                written = await save_gas_actualdata(gas_consume, hass, entry_id)
+        except Exception:
+            # The in-memory copy is now ahead of the file; force a reload next time.
+            invalidate_gas_consume(hass, entry_id)
+            raise
+        metrics.count(COUNTER_BYTES_WRITTEN, written)
+        cache["gas_consume"] = gas_consume
+        cache["gas_consume_signature"] = await hass.async_add_executor_job(
+            _stat_signature, get_gas_log_path(hass, entry_id)
+        )
+
+def parse_readings(items, numbers=None):
+    """
+    Turns imported readings into (datetime, consumed_gas) pairs.
+    Each item is either a mapping with "datetime" and "consumed_gas" keys or a
+    [datetime, consumed_gas] pair; datetimes may be strings or datetime objects.
+    An invalid item raises ValueError with its row number (`numbers`, default 1, 2, ...)
+    but not its values, since the file may not be a readings file at all.
+    """
+    readings = []
+    for number, item in zip(numbers or itertools.count(1), items):
+        try:
+            if isinstance(item, dict):
+                when, consumed_gas = item["datetime"], item["consumed_gas"]
+            else:
+                when, consumed_gas = item
+            if isinstance(when, str):
+                when = string_to_datetime(when.strip())
+            readings.append((when, float(consumed_gas)))
+        except (ValueError, KeyError, TypeError):
+            raise ValueError(f"row {number} is not a valid reading (datetime, consumed_gas)") from None
+    return readings
+
+def read_readings_file(path):
+    """
+    Reads readings from a CSV file (columns: datetime, consumed_gas; the header row
+    is optional) or a JSON file (a list of readings, see parse_readings). Errors name
+    the line of the CSV file or the position in the JSON list.
+    """
+    path = Path(path)
+    with open(path, newline="", encoding="utf-8") as file:
+        if path.suffix.lower() == ".json":
+            items = json.load(file)
+            if not isinstance(items, list):
+                raise ValueError("the JSON file has to hold a list of readings")
+            return parse_readings(items)
+        reader = csv.reader(file)
+        rows = [(reader.line_num, row) for row in reader if row and row[0].strip()]
+    if rows and rows[0][1][0].strip().lower() == "datetime":
+        rows = rows[1:]
+    return parse_readings((row[:2] for _line, row in rows), [line for line, _row in rows])
@@ -0,0 +1,292 @@
+import math
+from bisect import bisect_right
+from datetime import datetime, timezone
+from statistics import NormalDist
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.util import dt as dt_util
+from .const import DOMAIN, CONF_BILLING_DAY, DEFAULT_BILLING_DAY, DEFAULT_BOILER_AV_M, DEFAULT_LATEST_GAS_DATA
+from .rollups import PERIOD_HOUR, bucket_starts
+
+# The hour-of-day profile is averaged over the complete days of this many days of hourly buckets
+PROFILE_DAYS = 28
+FORECAST_CONFIDENCE = 0.95
+
+HORIZON_DAY = "day"
+HORIZON_WEEK = "week"
+HORIZON_BILLING = "billing_period"
+HORIZONS = (HORIZON_DAY, HORIZON_WEEK, HORIZON_BILLING)
+HORIZON_SECONDS = {HORIZON_DAY: 86400, HORIZON_WEEK: 7 * 86400}
+
+# What the profile was built from: boiler on-minutes (× the rate) or, without any boiler
+# history, the metered consumption spread over the reading intervals
+BASIS_ON_TIME = "on_time"
+BASIS_METERED = "metered"
+
+
+def estimated_reading(entry_data, when):
+    """Latest reading + boiler on-minutes between it and `when` × the average rate."""
+    latest_gas_data = entry_data.get("latest_gas_data", DEFAULT_LATEST_GAS_DATA)
+    latest_gas_update = entry_data.get("latest_gas_update")
+    tracker = entry_data.get("boiler_tracker")
+    if not tracker or not latest_gas_update or when <= latest_gas_update:
+        return latest_gas_data
+    on_seconds, _missing = tracker.on_seconds_observed(latest_gas_update, when)
+    return latest_gas_data + on_seconds / 60 * entry_data.get("average_m3_per_min", DEFAULT_BOILER_AV_M)
+
+
+def reading_at(gas_consume, timestamp):
+    """Meter reading at `timestamp`, interpolated between the records around it (None before the first)."""
+    timestamps = gas_consume.timestamps
+    gas = gas_consume.column("consumed_gas")
+    index = bisect_right(timestamps, timestamp) - 1
+    if index < 0:
+        return None
+    if index == len(timestamps) - 1 or timestamps[index] == timestamp:
+        return gas[index]
+    share = (timestamp - timestamps[index]) / (timestamps[index + 1] - timestamps[index])
+    return gas[index] + share * (gas[index + 1] - gas[index])
+
+
+def billing_period(now, billing_day):
+    """Local (start, end) of the billing period containing `now`; periods start on `billing_day` at midnight."""
+    local = dt_util.as_local(now)
+    start = local.replace(day=billing_day, hour=0, minute=0, second=0, microsecond=0)
+    if start > local:
+        start = _add_months(start, -1)
+    return start, _add_months(start, 1)
+
+def _add_months(local, months):
+    month = local.month - 1 + months
+    return local.replace(year=local.year + month // 12, month=month % 12 + 1)
+
+
+# Projected consumption for the next day, the next week and the billing period, and the
+# expected meter reading at any time.
+# The projection is the meter's recent hour-of-day profile of boiler on-minutes (from the
+# hourly rollup buckets) × the average rate, added to the current estimated reading. The
+# profile only changes when a day completes or the records change, so it is built once per
+# day or reading; the projections are cached until the next reading, boiler transition or
+# minute, so every forecast entity of a batch shares one computation.
+class ConsumptionForecaster:
+
+    def __init__(self, hass: HomeAssistant, entry_id, rollups, tracker):
+        self.hass = hass
+        self._entry_id = entry_id
+        self._rollups = rollups
+        self._tracker = tracker
+        self._unsub = None
+        self._profile = None
+        self._profile_day = None
+        # (billing period start, meter reading then) taken from the records
+        self._billing_start = None
+        self._revision = 0
+        self._cache = None
+        # Profile builds, forecasts computed and forecasts served from the cache
+        self.profile_builds = 0
+        self.computations = 0
+        self.cache_hits = 0
+
+    @property
+    def stats(self):
+        profile = self._profile
+        return {
+            "basis": profile["basis"] if profile else None,
+            "profile_days": profile["days"] if profile else None,
+            "revision": self._revision,
+            "profile_builds": self.profile_builds,
+            "computations": self.computations,
+            "cache_hits": self.cache_hits,
+        }
+
+    @callback
+    def async_start(self):
+        self._unsub = self._tracker.async_add_listener(self._invalidate)
+
+    @callback
+    def async_stop(self):
+        if self._unsub:
+            self._unsub()
+            self._unsub = None
+
+    @callback
+    def _invalidate(self):
+        """The current reading changed (boiler transition); projections are recomputed on next use."""
+        self._revision += 1
+        self._cache = None
+
+    @callback
+    def records_changed(self, gas_consume):
+        """New or corrected readings: the rate, the metered history and the billing start reading may differ."""
+        self._invalidate()
+        self._profile_day = None
+        start, _end = billing_period(dt_util.utcnow(), self._billing_day())
+        reading = reading_at(gas_consume, start.timestamp()) if gas_consume else None
+        if reading is None and gas_consume:
+            # The period started before the first record
+            reading = gas_consume.column("consumed_gas")[0]
+        self._billing_start = (start.timestamp(), reading)
+
+    def _entry_data(self):
+        return self.hass.data[DOMAIN][self._entry_id]
+
+    def _billing_day(self):
+        return self.hass.config_entries.async_get_entry(self._entry_id).options.get(CONF_BILLING_DAY, DEFAULT_BILLING_DAY)
+
+    def _build_profile(self, today_start):
+        """Mean on-minutes (or metered m³) per local hour of day and the spread of daily totals."""
+        self.profile_builds += 1
+        buckets = self._rollups.buckets_between(PERIOD_HOUR, today_start - PROFILE_DAYS * 86400, today_start)
+        if not buckets:
+            return None
+        # Days before the first bucket weren't observed; later days without buckets had no consumption
+        first_day = bucket_starts(buckets[0][0])[1]
+        days = max(round((today_start - first_day) / 86400), 1)
+        hourly = {BASIS_ON_TIME: [0.0] * 24, BASIS_METERED: [0.0] * 24}
+        daily = {BASIS_ON_TIME: {}, BASIS_METERED: {}}
+        for start, (metered, _estimated, on_minutes) in buckets:
+            _hour, day_start, _month = bucket_starts(start)
+            hour = min(int((start - day_start) // 3600), 23)
+            for basis, value in ((BASIS_ON_TIME, on_minutes), (BASIS_METERED, metered)):
+                hourly[basis][hour] += value
+                daily[basis][day_start] = daily[basis].get(day_start, 0.0) + value
+        basis = BASIS_ON_TIME if sum(hourly[BASIS_ON_TIME]) > 0 else BASIS_METERED
+        totals = list(daily[basis].values()) + [0.0] * (days - len(daily[basis]))
+        mean = sum(totals) / days
+        spread = math.sqrt(sum((total - mean) ** 2 for total in totals) / (days - 1)) if days > 1 else None
+        return {
+            "basis": basis,
+            "days": days,
+            "hourly": [value / days for value in hourly[basis]],
+            "daily_spread": spread,
+        }
+
+    def _profile_for(self, now):
+        today_start = bucket_starts(now)[1]
+        if self._profile_day != today_start:
+            self._profile = self._build_profile(today_start)
+            self._profile_day = today_start
+        return self._profile
+
+    @staticmethod
+    def _integrate(profile, start, end):
+        """Profile units (on-minutes or m³) expected between two UTC epochs."""
+        if end <= start:
+            return 0.0
+        days, rest = divmod(end - start, 86400)
+        total = days * sum(profile["hourly"])
+        # The remaining part of a day, hour by hour
+        while rest > 0:
+            local = dt_util.as_local(datetime.fromtimestamp(start, timezone.utc))
+            into_hour = local.minute * 60 + local.second + local.microsecond / 1e6
+            piece = min(3600 - into_hour, rest)
+            total += profile["hourly"][local.hour] * piece / 3600
+            start += piece
+            rest -= piece
+        return total
+
+    def _rates(self):
+        """Average rate and its confidence bounds (the rate itself without a fitted interval)."""
+        entry_data = self._entry_data()
+        rate = entry_data.get("average_m3_per_min", DEFAULT_BOILER_AV_M)
+        fit = entry_data.get("rate_fit")
+        if fit and fit["rate"] is not None and fit["ci_low"] is not None:
+            return rate, max(fit["ci_low"], 0.0), fit["ci_high"]
+        return rate, rate, rate
+
+    def _project(self, profile, start, end):
+        """(expected, low, high) m³ consumed between two UTC epochs; None without a profile."""
+        if profile is None:
+            return None
+        units = self._integrate(profile, start, end)
+        low = high = units
+        if profile["daily_spread"] is not None:
+            z = NormalDist().inv_cdf(0.5 + FORECAST_CONFIDENCE / 2)
+            margin = z * profile["daily_spread"] * math.sqrt((end - start) / 86400)
+            low, high = max(units - margin, 0.0), units + margin
+        if profile["basis"] == BASIS_METERED:
+            return units, low, high
+        rate, rate_low, rate_high = self._rates()
+        return units * rate, low * rate_low, high * rate_high
+
+    def forecast(self, now=None):
+        """Projections for the next day, week and the billing period (cached, see above)."""
+        now = now or dt_util.utcnow()
+        key = (self._revision, int(now.timestamp() // 60))
+        if self._cache is not None and self._cache[0] == key:
+            self.cache_hits += 1
+            return self._cache[1]
+        self.computations += 1
+        result = self._compute(now)
+        self._cache = (key, result)
+        return result
+
+    def _compute(self, now):
+        entry_data = self._entry_data()
+        now_ts = now.timestamp()
+        profile = self._profile_for(now_ts)
+        reading = estimated_reading(entry_data, now)
+        result = {
+            "generated_at": dt_util.as_local(now).isoformat(),
+            "basis": profile["basis"] if profile else None,
+            "profile_days": profile["days"] if profile else None,
+            "rate_m3_per_min": self._rates()[0],
+            "reading": round(reading, 3),
+        }
+        for horizon, seconds in HORIZON_SECONDS.items():
+            result[horizon] = self._horizon(profile, reading, now_ts, now_ts + seconds)
+
+        start, end = billing_period(now, self._billing_day())
+        billing = self._horizon(profile, reading, now_ts, end.timestamp())
+        start_reading = self._billing_start_reading(entry_data, start)
+        consumed = reading - start_reading if start_reading is not None else None
+        billing.update(start=start.isoformat(), consumed=_round(consumed), remaining=billing.pop("consumption"))
+        if consumed is not None and billing["remaining"] is not None:
+            billing["consumption"] = round(consumed + billing["remaining"], 3)
+            billing["low"] = round(consumed + billing["low"], 3)
+            billing["high"] = round(consumed + billing["high"], 3)
+        else:
+            billing.update(consumption=None, low=None, high=None)
+        result[HORIZON_BILLING] = billing
+        return result
+
+    def _horizon(self, profile, reading, start, end):
+        projection = self._project(profile, start, end)
+        expected, low, high = projection if projection else (None, None, None)
+        return {
+            "end": dt_util.as_local(datetime.fromtimestamp(end, timezone.utc)).isoformat(),
+            "consumption": _round(expected),
+            "low": _round(low),
+            "high": _round(high),
+            "expected_reading": _round(reading + expected if expected is not None else None),
+        }
+
+    def _billing_start_reading(self, entry_data, start):
+        latest_gas_update = entry_data.get("latest_gas_update")
+        if latest_gas_update and start > latest_gas_update:
+            # The period started after the latest reading (no new reading since)
+            return estimated_reading(entry_data, start)
+        if self._billing_start is not None and self._billing_start[0] == start.timestamp():
+            return self._billing_start[1]
+        # The records haven't been read yet
+        return None
+
+    def expected_reading(self, when, gas_consume=None, now=None):
+        """
+        Meter reading expected at `when`: from the records before the latest reading (needs
+        `gas_consume`), the boiler on-time up to now and the projection after it.
+        """
+        now = now or dt_util.utcnow()
+        entry_data = self._entry_data()
+        latest_gas_update = entry_data.get("latest_gas_update")
+        if latest_gas_update and when < latest_gas_update:
+            return reading_at(gas_consume, when.timestamp()) if gas_consume else None
+        if when <= now:
+            return estimated_reading(entry_data, when)
+        projection = self._project(self._profile_for(now.timestamp()), now.timestamp(), when.timestamp())
+        if projection is None:
+            return None
+        return estimated_reading(entry_data, now) + projection[0]
+
+
+def _round(value):
+    return round(value, 3) if value is not None else None
@@ -1,26 +1,333 @@
-from collections import UserList
+import math
+from array import array
+from bisect import bisect_left, bisect_right
+from collections.abc import MutableMapping
+from datetime import datetime, timezone
+from homeassistant.util import dt as dt_util
+
+# Numeric record fields, each stored in its own float64 column.
+# A missing value is stored as NaN and reported as an absent key.
+FIELDS = (
+    "consumed_gas",
+    "consumed_gas_cumulated",
+    "min_cumulated",
+    "m3/min for interval",
+    "average m3/min",
+)
+
+def to_timestamp(value):
+    """Converts a datetime (naive values are taken as HA local time) to a UTC epoch."""
+    return dt_util.as_utc(value).timestamp()
+
+def from_timestamp(timestamp):
+    """Converts a UTC epoch back to a timezone-aware local datetime."""
+    return dt_util.as_local(datetime.fromtimestamp(timestamp, timezone.utc))
+
+
+def format_record(record):
+    """User-friendly representation of a record for the dashboard."""
+    return {
+        "datetime": record["datetime"].strftime('%Y-%m-%d %H:%M:%S'),
+        "consumed_gas": f"{record['consumed_gas']:.3f} m³",
+        "consumed_gas_cumulated": f"{record.get('consumed_gas_cumulated', 0):.3f} m³",
+    }
+
+
+# Dict-like view of a single record, backed by the GasConsume columns.
+class GasRecord(MutableMapping):
+    __slots__ = ("_owner", "_index")
+
+    def __init__(self, owner, index):
+        self._owner = owner
+        self._index = index
+
+    def __getitem__(self, key):
+        if key == "datetime":
+            return from_timestamp(self._owner._timestamps[self._index])
+        value = self._owner._columns[key][self._index]
+        if math.isnan(value):
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        if key == "datetime":
+            raise KeyError("The datetime of a record can't be changed in place")
+        self._owner._columns[key][self._index] = float(value)
+        self._owner._touch(self._index)
+
+    def __delitem__(self, key):
+        self[key]
+        self._owner._columns[key][self._index] = math.nan
+        self._owner._touch(self._index)
+
+    def __iter__(self):
+        yield "datetime"
+        for key in FIELDS:
+            if not math.isnan(self._owner._columns[key][self._index]):
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return repr(dict(self))
+
 
 # Class for storing and managing records.
-class GasConsume(UserList):
+# Records are kept column-wise in typed arrays ordered by time, so a record costs a few
+# float64 slots instead of a dict, and time lookups are a bisect on the timestamp column.
+class GasConsume:
+
+    def __init__(self, records=None):
+        self._timestamps = array("d")
+        self._columns = {key: array("d") for key in FIELDS}
+        # Bookkeeping for the append-only record log (see file_handler):
+        # records from index `persisted` on still have to be written,
+        # `log_frames` is the number of journal frames currently in the log.
+        self.persisted = 0
+        self.log_frames = 0
+        # Timestamps of records deleted since the last save
+        self.deleted = []
+        # Bumped whenever a record other than the newest one changes, so caches
+        # built from older records know they have to be rebuilt.
+        self.revision = 0
+        for record in records or ():
+            self._append(record["datetime"], record)
+
+    @classmethod
+    def from_columns(cls, timestamps, columns):
+        """
+        Builds an instance around an array("d") of timestamps and {field: array("d")}
+        columns without copying them; fields without a column are all missing. Columns
+        of fields this version doesn't know (e.g. from a newer version's log) are kept
+        in their order and carried through unchanged, missing for records added here.
+        """
+        gas_consume = cls()
+        gas_consume._timestamps = timestamps
+        gas_consume._columns = dict(columns)
+        for key in FIELDS:
+            if key not in columns:
+                gas_consume._columns[key] = array("d", [math.nan]) * len(timestamps)
+        return gas_consume
+
+    def _append(self, datetime, values):
+        self._timestamps.append(to_timestamp(datetime))
+        for key, column in self._columns.items():
+            value = values.get(key)
+            column.append(math.nan if value is None else float(value))
+
+    def _touch(self, index):
+        """Marks a record as changed so the next save writes it again."""
+        if index < self.persisted:
+            self.persisted = index
+        if index < len(self) - 1:
+            self.revision += 1
 
-    # Add record to self.data
+    # Add record to the end of the columns
     def add_record(self, datetime, consumed_gas):
-        self.data.append(
-            {
-                "datetime": datetime,
-                "consumed_gas": float(consumed_gas)
-            }
+        self._append(datetime, {"consumed_gas": consumed_gas})
+
+    def upsert(self, when, consumed_gas):
+        """
+        Inserts a reading at its place in time, or corrects the reading of an existing
+        record with the same timestamp.
+        Returns (index, indices of the intervals that have to be measured again).
+        """
+        timestamp = to_timestamp(when)
+        index = bisect_left(self._timestamps, timestamp)
+        if index < len(self) and self._timestamps[index] == timestamp:
+            # Same interval boundaries, only the reading changes
+            self._columns["consumed_gas"][index] = float(consumed_gas)
+            self._touch(index)
+            return index, []
+
+        self._timestamps.insert(index, timestamp)
+        for key, column in self._columns.items():
+            column.insert(index, float(consumed_gas) if key == "consumed_gas" else math.nan)
+        self._touch(index)
+        if index < len(self) - 1:
+            self.revision += 1
+        # The new record splits the interval it falls into
+        return index, [i for i in (index, index + 1) if 0 < i < len(self)]
+
+    def delete(self, when):
+        """
+        Deletes the record with the given timestamp and returns its former index.
+        The neighbouring intervals simply merge: their on-minutes add up, so no interval
+        has to be measured again. Raises KeyError if there is no such record.
+        """
+        timestamp = to_timestamp(when)
+        index = bisect_left(self._timestamps, timestamp)
+        if index == len(self) or self._timestamps[index] != timestamp:
+            raise KeyError(when)
+        del self._timestamps[index]
+        for column in self._columns.values():
+            del column[index]
+        self.deleted.append(timestamp)
+        self._touch(index)
+        self.revision += 1
+        return index
+
+    def merge_readings(self, readings):
+        """
+        Merges (datetime, consumed_gas) readings into the history in one pass; a reading
+        with the timestamp of an existing record replaces it. Only the records from the
+        oldest reading on are rebuilt, so readings at the end cost O(readings).
+        Returns (first changed index, indices of the intervals that have to be measured again).
+        """
+        merged = {to_timestamp(when): float(consumed_gas) for when, consumed_gas in readings}
+        if not merged:
+            return len(self), []
+
+        first = bisect_left(self._timestamps, min(merged))
+        old_columns = {key: column[first:] for key, column in self._columns.items()}
+        old = {timestamp: offset for offset, timestamp in enumerate(self._timestamps[first:])}
+        timestamps = sorted(old.keys() | merged.keys())
+
+        columns = {key: array("d") for key in self._columns}
+        first_changed = first + len(timestamps)
+        stale = []
+        # The record before `first` is unchanged
+        previous_old_offset = -1
+        for offset, timestamp in enumerate(timestamps):
+            index = first + offset
+            old_offset = old.get(timestamp)
+            for key, column in columns.items():
+                column.append(math.nan if old_offset is None else old_columns[key][old_offset])
+            if timestamp in merged:
+                columns["consumed_gas"][offset] = merged[timestamp]
+                first_changed = min(first_changed, index)
+            # The interval is still valid if the record and its predecessor are unchanged
+            if old_offset is None or old_offset != previous_old_offset + 1:
+                first_changed = min(first_changed, index)
+                if index > 0:
+                    stale.append(index)
+            previous_old_offset = old_offset if old_offset is not None else -2
+
+        self._timestamps[first:] = array("d", timestamps)
+        for key, column in self._columns.items():
+            column[first:] = columns[key]
+        if first_changed < len(self):
+            self._touch(first_changed)
+            self.revision += 1
+        return first_changed, stale
+
+    def recompute(self, start, minutes=None):
+        """
+        Recomputes the derived fields from record `start` on.
+        `minutes` maps the index of an interval that was measured again to its boiler
+        on-minutes; every other interval keeps the on-minutes it had (the difference of the
+        stored cumulative minutes), so cumulative minutes remain a running prefix sum.
+        """
+        minutes = minutes or {}
+        gas = self._columns["consumed_gas"]
+        rate = self._columns["m3/min for interval"]
+        gas_cumulated = self._columns["consumed_gas_cumulated"]
+        min_cumulated = self._columns["min_cumulated"]
+        average = self._columns["average m3/min"]
+        start = max(start, 0)
+        if start >= len(self):
+            return
+        self._touch(start)
+        if start == 0:
+            # The first record has nothing to compare with. The cumulative minutes it still
+            # holds (when the record before it was deleted) are where the later ones count from.
+            previous_old = min_cumulated[0]
+            for column in (rate, gas_cumulated, min_cumulated, average):
+                column[0] = math.nan
+            start = 1
+        else:
+            previous_old = min_cumulated[start - 1]
+        cumulated = min_cumulated[start - 1] if start > 1 else 0.0
+        if math.isnan(cumulated):
+            cumulated = 0.0
+        if math.isnan(previous_old):
+            previous_old = cumulated
+        for index in range(start, len(self)):
+            old = min_cumulated[index]
+            if math.isnan(old):
+                old = previous_old
+            interval = minutes[index] if index in minutes else old - previous_old
+            previous_old = old
+
+            # m3/min for the interval since the previous reading ("m3/min for interval")
+            rate[index] = (gas[index] - gas[index - 1]) / interval if interval else math.nan
+            # Gas consumed from the first reading till this one ("consumed_gas_cumulated")
+            gas_cumulated[index] = gas[index] - gas[0]
+            # Boiler on-minutes from the first reading till this one ("min_cumulated")
+            cumulated += interval
+            min_cumulated[index] = cumulated
+            # m3/min for the whole period from the first reading till this one ("average m3/min")
+            average[index] = gas_cumulated[index] / cumulated if cumulated else math.nan
+
+    def column(self, key):
+        """Returns the raw float64 column of a field (NaN = missing)."""
+        return self._columns[key]
+
+    @property
+    def fields(self):
+        """Fields of all columns in their stored order (FIELDS and any carried through, see from_columns)."""
+        return tuple(self._columns)
+
+    @property
+    def timestamps(self):
+        """Returns the raw UTC epoch column."""
+        return self._timestamps
+
+    def index_at_or_before(self, when):
+        """Index of the latest record at or before `when`, or -1 if there is none."""
+        return bisect_right(self._timestamps, to_timestamp(when)) - 1
+
+    def record_at_or_before(self, when):
+        """Latest record at or before `when`, or None."""
+        index = self.index_at_or_before(when)
+        return GasRecord(self, index) if index >= 0 else None
+
+    def index_range(self, start=None, end=None):
+        """Range of indices of the records with start <= datetime <= end (None = open end)."""
+        return range(
+            bisect_left(self._timestamps, to_timestamp(start)) if start is not None else 0,
+            bisect_right(self._timestamps, to_timestamp(end)) if end is not None else len(self),
         )
 
+    def records_between(self, start, end):
+        """Records with start <= datetime <= end."""
+        return [GasRecord(self, index) for index in self.index_range(start, end)]
+
+    def __len__(self):
+        return len(self._timestamps)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [GasRecord(self, i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("GasConsume index out of range")
+        return GasRecord(self, index)
+
     # Convert entire object to list of dictionaries (JSON serializable)
     def to_list(self):
-        return self.data
+        return [dict(record) for record in self]
 
-    # Optional: Automatically return JSON-compatible list when serialized
     def __iter__(self):
         """Ensure the class behaves like a list during iteration."""
-        return iter(self.to_list())
+        return (GasRecord(self, index) for index in range(len(self)))
 
-    # Optional: Automatic JSON serialization (if you want to use json.dumps directly)
     def __repr__(self):
         return str(self.to_list())
+
+    def __getstate__(self):
+        return {
+            "timestamps": self._timestamps,
+            "columns": self._columns,
+        }
+
+    def __setstate__(self, state):
+        # Pickles written before the columnar layout hold a UserList state ({"data": [...]}).
+        records = state.get("data")
+        self.__init__(records)
+        if records is None:
+            self._timestamps = state["timestamps"]
+            for key in FIELDS:
+                self._columns[key] = state["columns"].get(key, array("d", [math.nan] * len(self._timestamps)))
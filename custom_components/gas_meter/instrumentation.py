@@ -0,0 +1,107 @@
+import time
+from collections import deque
+from contextlib import contextmanager
+from .const import DOMAIN
+
+# State writes are reported per this window (seconds)
+STATE_WRITE_WINDOW = 60
+
+# Timed hot paths
+TIMING_LOAD = "load"
+TIMING_SAVE = "save"
+TIMING_RECORDER = "recorder_query"
+TIMING_RENDER = "render"
+TIMING_RECORDS_UPDATE = "records_update"
+
+# Counters
+COUNTER_BYTES_READ = "bytes_read"
+COUNTER_BYTES_WRITTEN = "bytes_written"
+COUNTER_RECORDER_ROWS = "recorder_rows"
+
+
+def get_metrics(hass, entry_id):
+    """Returns the MeterMetrics of a config entry."""
+    entry_data = hass.data.setdefault(DOMAIN, {}).setdefault(entry_id, {})
+    if "metrics" not in entry_data:
+        entry_data["metrics"] = MeterMetrics()
+    return entry_data["metrics"]
+
+
+# Timings and counters of one meter's hot paths.
+# Timings and counters are only collected while profiling is on (gas_meter.set_profiling);
+# otherwise a timer costs one attribute check. State writes are always counted.
+class MeterMetrics:
+
+    def __init__(self):
+        self.profiling = False
+        # name -> [count, total seconds, last seconds, max seconds]
+        self._timings = {}
+        self._counters = {}
+        self._state_writes = deque()
+        self.state_writes = 0
+
+    @contextmanager
+    def timer(self, name):
+        """Times the enclosed block (awaits included) as `name` while profiling."""
+        if not self.profiling:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_timing(name, time.perf_counter() - started)
+
+    def add_timing(self, name, seconds):
+        timing = self._timings.setdefault(name, [0, 0.0, 0.0, 0.0])
+        timing[0] += 1
+        timing[1] += seconds
+        timing[2] = seconds
+        timing[3] = max(timing[3], seconds)
+
+    def count(self, name, amount=1):
+        if self.profiling:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def state_written(self):
+        now = time.monotonic()
+        self.state_writes += 1
+        self._state_writes.append(now)
+        self._trim(now)
+
+    def _trim(self, now):
+        while self._state_writes and self._state_writes[0] < now - STATE_WRITE_WINDOW:
+            self._state_writes.popleft()
+
+    @property
+    def state_writes_per_minute(self):
+        self._trim(time.monotonic())
+        return len(self._state_writes) * 60 / STATE_WRITE_WINDOW
+
+    def timing(self, name):
+        """{"count", "last_ms", "mean_ms", "max_ms"} of a timing (None if never measured)."""
+        if name not in self._timings:
+            return None
+        count, total, last, maximum = self._timings[name]
+        return {
+            "count": count,
+            "last_ms": round(last * 1000, 3),
+            "mean_ms": round(total / count * 1000, 3),
+            "max_ms": round(maximum * 1000, 3),
+        }
+
+    def counter(self, name):
+        return self._counters.get(name, 0)
+
+    def reset(self):
+        self._timings.clear()
+        self._counters.clear()
+
+    def as_dict(self):
+        return {
+            "profiling": self.profiling,
+            "timings": {name: self.timing(name) for name in sorted(self._timings)},
+            "counters": dict(sorted(self._counters.items())),
+            "state_writes": self.state_writes,
+            "state_writes_per_minute": self.state_writes_per_minute,
+        }
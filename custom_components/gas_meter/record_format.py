@@ -0,0 +1,269 @@
+import io
+import math
+import pickle
+import struct
+import sys
+import zlib
+from array import array
+from zoneinfo import ZoneInfo
+import numpy as np
+from .gas_consume import to_timestamp
+
+# Binary record log, version 1. All numbers are little-endian.
+#
+#   header   magic, format version, field count, record count, then every field name
+#            (length-prefixed UTF-8) and the crc32 of the header
+#   base     the timestamp column (UTC epoch) and one column per field, each a run of
+#            `record count` float64 values (NaN = missing), followed by their crc32
+#   journal  fixed-size frames appended since the base was written:
+#            <payload length><crc32 of payload><kind><timestamp><one float64 per field>
+#
+# The base is only ever written whole (to a temporary file that replaces the log), so it
+# is decoded in bulk straight into arrays. A journal frame with a later timestamp wins
+# over the base and earlier frames, a "deleted" frame removes the record; a torn frame at
+# the end is reported so it can be cut off.
+#
+# The field names in the header make the schema self-describing: fields the reader does
+# not know are carried along unchanged, fields the file lacks are read as NaN. Only layout changes bump
+# FORMAT_VERSION; a log written by a newer layout is refused, never rewritten.
+MAGIC = b"GASMETER"
+FORMAT_VERSION = 1
+_HEADER = struct.Struct("<8sHHQ")
+_NAME_LENGTH = struct.Struct("<B")
+_CRC = struct.Struct("<I")
+_FRAME_HEADER = struct.Struct("<II")
+
+FRAME_RECORD = 0
+FRAME_DELETED = 1
+
+# Columns are written and read as raw array buffers, which are native-endian
+_BIG_ENDIAN = sys.byteorder == "big"
+
+
+class RecordFormatError(ValueError):
+    """The record log can't be read (not a record log, a newer format or a damaged base)."""
+
+
+def _payload_struct(field_count):
+    return struct.Struct(f"<Bd{field_count}d")
+
+def _frame_dtype(field_count):
+    return np.dtype([
+        ("length", "<u4"), ("crc", "<u4"), ("kind", "u1"), ("timestamp", "<f8"), ("values", "<f8", (field_count,)),
+    ])
+
+def _encode_header(fields, count):
+    header = bytearray(_HEADER.pack(MAGIC, FORMAT_VERSION, len(fields), count))
+    for name in fields:
+        encoded = name.encode()
+        header += _NAME_LENGTH.pack(len(encoded)) + encoded
+    return bytes(header) + _CRC.pack(zlib.crc32(header))
+
+def write_base(file, gas_consume):
+    """Writes `gas_consume` as a log without journal to a binary file object; returns the bytes written."""
+    fields = gas_consume.fields
+    columns = [gas_consume.timestamps] + [gas_consume.column(key) for key in fields]
+    written = file.write(_encode_header(fields, len(gas_consume)))
+    crc = 0
+    for column in columns:
+        if _BIG_ENDIAN:
+            column = array("d", column)
+            column.byteswap()
+        # array.array exposes its buffer; no intermediate copies
+        written += file.write(column)
+        crc = zlib.crc32(column, crc)
+    return written + file.write(_CRC.pack(crc))
+
+def encode_frames(gas_consume, deleted, start):
+    """
+    Journal frames for the `deleted` timestamps and the records from index `start` on,
+    with the fields of `gas_consume` (which have to be the fields of the log's base).
+    """
+    fields = gas_consume.fields
+    payload_struct = _payload_struct(len(fields))
+    frames = bytearray()
+
+    def add(kind, timestamp, values):
+        payload = payload_struct.pack(kind, timestamp, *values)
+        frames.extend(_FRAME_HEADER.pack(len(payload), zlib.crc32(payload)))
+        frames.extend(payload)
+
+    # Deletions first: a deleted timestamp may have been re-added since
+    missing = [math.nan] * len(fields)
+    for timestamp in deleted:
+        add(FRAME_DELETED, timestamp, missing)
+    timestamps = gas_consume.timestamps
+    columns = [gas_consume.column(key) for key in fields]
+    for index in range(start, len(gas_consume)):
+        add(FRAME_RECORD, timestamps[index], [column[index] for column in columns])
+    return bytes(frames)
+
+def _read_exactly(file, size, what):
+    data = file.read(size)
+    if len(data) != size:
+        raise RecordFormatError(f"Truncated record log {what}")
+    return data
+
+def read_log(file):
+    """
+    Reads a record log from a binary file object.
+    Returns (timestamps, {field: column} for every field of the file in its order, fields
+    of the file, number of journal frames, length of the valid data). Columns are array("d").
+    """
+    header = bytearray(file.read(_HEADER.size))
+    if len(header) < _HEADER.size or bytes(header[:len(MAGIC)]) != MAGIC:
+        raise RecordFormatError("Not a gas meter record log")
+    _magic, version, field_count, count = _HEADER.unpack_from(header)
+    if version > FORMAT_VERSION:
+        raise RecordFormatError(f"Record log format {version} is newer than the supported format {FORMAT_VERSION}")
+
+    fields = []
+    try:
+        for _ in range(field_count):
+            length = _read_exactly(file, _NAME_LENGTH.size, "header")
+            name = _read_exactly(file, _NAME_LENGTH.unpack(length)[0], "header")
+            header += length + name
+            fields.append(name.decode())
+    except UnicodeDecodeError as err:
+        raise RecordFormatError("Damaged record log header") from err
+    if zlib.crc32(header) != _CRC.unpack(_read_exactly(file, _CRC.size, "header"))[0]:
+        raise RecordFormatError("Damaged record log header")
+
+    # One read per column keeps the peak memory at one column on top of the result
+    crc = 0
+    base_columns = []
+    for _ in range(field_count + 1):
+        column = array("d")
+        column.frombytes(_read_exactly(file, count * 8, "base"))
+        crc = zlib.crc32(column, crc)
+        if _BIG_ENDIAN:
+            column.byteswap()
+        base_columns.append(column)
+    if crc != _CRC.unpack(_read_exactly(file, _CRC.size, "base"))[0]:
+        raise RecordFormatError("Damaged record log base")
+    base_end = len(header) + _CRC.size + (field_count + 1) * count * 8 + _CRC.size
+
+    timestamps = base_columns[0]
+    columns = {key: base_columns[index + 1] for index, key in enumerate(fields)}
+
+    journal, journal_size = _read_journal(file.read(), field_count)
+    if len(journal):
+        timestamps, columns = _apply_journal(timestamps, columns, fields, journal)
+    return timestamps, columns, tuple(fields), len(journal), base_end + journal_size
+
+def _read_journal(data, field_count):
+    """The intact frames at the start of the journal (a structured array) and their length in bytes."""
+    dtype = _frame_dtype(field_count)
+    payload_size = dtype.itemsize - _FRAME_HEADER.size
+    count = len(data) // dtype.itemsize
+    frames = np.frombuffer(data, dtype=dtype, count=count)
+    view = memoryview(data)
+    crcs = np.fromiter(
+        (
+            zlib.crc32(view[offset:offset + payload_size])
+            for offset in range(_FRAME_HEADER.size, count * dtype.itemsize, dtype.itemsize)
+        ),
+        dtype="<u4",
+        count=count,
+    )
+    damaged = np.flatnonzero((frames["length"] != payload_size) | (frames["crc"] != crcs))
+    intact = int(damaged[0]) if len(damaged) else count
+    return frames[:intact], intact * dtype.itemsize
+
+def _apply_journal(timestamps, columns, fields, frames):
+    # The last frame of every timestamp wins
+    unique, last = np.unique(frames["timestamp"][::-1], return_index=True)
+    latest = frames[::-1][last]
+    is_record = latest["kind"] == FRAME_RECORD
+
+    base_timestamps = np.frombuffer(timestamps, dtype="<f8")
+    positions = np.searchsorted(base_timestamps, unique)
+    found = positions < len(base_timestamps)
+    found[found] = base_timestamps[positions[found]] == unique[found]
+
+    # Frames rewriting existing records (e.g. after a recompute) are applied in place
+    updated = found & is_record
+    for key, column in columns.items():
+        np.frombuffer(column, dtype="<f8")[positions[updated]] = latest["values"][updated, fields.index(key)]
+    deleted = found & ~is_record
+    added = latest[~found & is_record]
+    if not deleted.any() and not len(added):
+        return timestamps, columns
+
+    keep = np.ones(len(base_timestamps), dtype=bool)
+    keep[positions[deleted]] = False
+    merged_timestamps = np.concatenate((base_timestamps[keep], added["timestamp"]))
+    order = np.argsort(merged_timestamps, kind="stable")
+
+    def as_array(values):
+        column = array("d")
+        column.frombytes(np.ascontiguousarray(values[order], dtype="<f8").tobytes())
+        return column
+
+    merged_columns = {
+        key: as_array(np.concatenate((np.frombuffer(column, dtype="<f8")[keep], added["values"][:, fields.index(key)])))
+        for key, column in columns.items()
+    }
+    return as_array(merged_timestamps), merged_columns
+
+
+# Logs written before the binary format were pickled dicts, one per frame, and the very
+# first versions pickled the whole GasConsume. They are read once, for the migration,
+# and only with the few classes those pickles can contain.
+_LEGACY_PICKLE_CLASSES = {
+    ("datetime", "datetime"),
+    ("datetime", "timezone"),
+    ("datetime", "timedelta"),
+    ("zoneinfo", "ZoneInfo"),
+    ("zoneinfo", "ZoneInfo._unpickle"),
+    ("copyreg", "_reconstructor"),
+    ("copyreg", "__newobj__"),
+    ("builtins", "object"),
+    ("array", "_array_reconstructor"),
+    ("custom_components.gas_meter.gas_consume", "GasConsume"),
+    # bytes pickled with protocol < 3
+    ("_codecs", "encode"),
+}
+# ZoneInfo datetimes pickle their time zone as getattr(ZoneInfo, "_unpickle")(key, ...)
+_LEGACY_GETATTR = {("builtins", "getattr"), ("__builtin__", "getattr")}
+
+def _legacy_getattr(obj, name):
+    """getattr restricted to what the legacy pickles use it for."""
+    if obj is not ZoneInfo or name != "_unpickle":
+        raise pickle.UnpicklingError(f"Refusing to load getattr({obj!r}, {name!r}) from a legacy gas data file")
+    return ZoneInfo._unpickle
+
+class _LegacyUnpickler(pickle.Unpickler):
+
+    def find_class(self, module, name):
+        if (module, name) in _LEGACY_GETATTR:
+            return _legacy_getattr
+        if (module, name) not in _LEGACY_PICKLE_CLASSES:
+            raise pickle.UnpicklingError(f"Refusing to load {module}.{name} from a legacy gas data file")
+        return super().find_class(module, name)
+
+def legacy_loads(data):
+    """pickle.loads restricted to the classes of the legacy data files."""
+    return _LegacyUnpickler(io.BytesIO(data)).load()
+
+def read_legacy_log(data):
+    """
+    Replays a legacy pickled-frame log and returns its records, oldest first.
+    A later frame for the same datetime replaces the earlier one, a "deleted" frame
+    removes it; a torn tail is ignored.
+    """
+    records = {}
+    offset = 0
+    while offset + _FRAME_HEADER.size <= len(data):
+        length, crc = _FRAME_HEADER.unpack_from(data, offset)
+        start = offset + _FRAME_HEADER.size
+        payload = data[start:start + length]
+        if len(payload) != length or zlib.crc32(payload) != crc:
+            break
+        record = legacy_loads(payload)
+        if record.get("deleted"):
+            records.pop(to_timestamp(record["datetime"]), None)
+        else:
+            records[to_timestamp(record["datetime"])] = record
+        offset = start + length
+    return [records[timestamp] for timestamp in sorted(records)]
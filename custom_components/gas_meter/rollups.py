@@ -0,0 +1,261 @@
+import logging
+import math
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone
+from functools import lru_cache
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.storage import Store
+from homeassistant.util import dt as dt_util
+from .const import DOMAIN, DEFAULT_BOILER_AV_M
+from .gas_consume import to_timestamp
+
+_LOGGER = logging.getLogger(__name__)
+
+# Buckets used to have a store of their own; they are now part of the meter snapshot
+LEGACY_STORAGE_VERSION = 1
+LEGACY_STORAGE_KEY = f"{DOMAIN}.rollups"
+
+PERIOD_HOUR = "hour"
+PERIOD_DAY = "day"
+PERIOD_MONTH = "month"
+PERIODS = (PERIOD_HOUR, PERIOD_DAY, PERIOD_MONTH)
+# How long buckets are kept (seconds); monthly buckets are kept forever
+RETENTION = {PERIOD_HOUR: 92 * 86400, PERIOD_DAY: 5 * 366 * 86400}
+
+# Values of a bucket
+METERED = 0
+ESTIMATED = 1
+ON_MINUTES = 2
+
+
+def bucket_starts(timestamp):
+    """Start (UTC epoch) of the local hour, day and month `timestamp` falls into."""
+    # Time zone offsets are whole quarter hours, so every quarter hour lies in one bucket
+    return _bucket_starts(int(timestamp // 900))
+
+@lru_cache(maxsize=1024)
+def _bucket_starts(quarter):
+    local = dt_util.as_local(datetime.fromtimestamp(quarter * 900, timezone.utc))
+    hour = local.replace(minute=0, second=0, microsecond=0)
+    day = hour.replace(hour=0)
+    month = day.replace(day=1)
+    return hour.timestamp(), day.timestamp(), month.timestamp()
+
+
+def bucket_end(period, start):
+    """End (UTC epoch) of the bucket of `period` starting at `start`."""
+    if period == PERIOD_HOUR:
+        return start + 3600
+    # The next bucket starts in the next day/month; go past it and floor
+    step = 86400 if period == PERIOD_DAY else 32 * 86400
+    return bucket_starts(start + step + 3600)[PERIODS.index(period)]
+
+
+def spread(buckets, start, end, field, amount, now):
+    """
+    Adds `amount` of a field to `buckets` ({period: {start: values}}), spread linearly
+    over start..end. Only the part inside a period's retention goes into its buckets, so
+    old intervals are spread day by day or month by month instead of hour by hour.
+    """
+    duration = end - start
+    if duration <= 0:
+        return
+    # Oldest time kept in hourly and daily buckets
+    limits = (now - RETENTION[PERIOD_HOUR], now - RETENTION[PERIOD_DAY])
+    while start < end:
+        starts = bucket_starts(start)
+        finest = 0 if start >= limits[0] else 1 if start >= limits[1] else 2
+        piece_end = min(bucket_end(PERIODS[finest], starts[finest]), end)
+        if finest:
+            # Finer buckets take over at the retention limit
+            piece_end = min(piece_end, limits[finest - 1])
+        share = amount * (piece_end - start) / duration
+        for period, bucket_start in zip(PERIODS[finest:], starts[finest:]):
+            values = buckets[period].setdefault(bucket_start, [0.0, 0.0, 0.0])
+            values[field] += share
+        start = piece_end
+
+
+def metered_buckets(gas_consume, now):
+    """{period: {start: values}} with the metered consumption of all intervals of the records."""
+    buckets = {period: {} for period in PERIODS}
+    timestamps = gas_consume.timestamps
+    gas = gas_consume.column("consumed_gas")
+    for index in range(1, len(gas_consume)):
+        consumed_gas = gas[index] - gas[index - 1]
+        if not math.isnan(consumed_gas):
+            spread(buckets, timestamps[index - 1], timestamps[index], METERED, consumed_gas, now)
+    return buckets
+
+
+def intervals_around(gas_consume, timestamps):
+    """
+    (start, end, consumed gas) of the intervals that touch any of `timestamps`: the ones
+    ending and starting at a record with that timestamp, or the interval it falls into.
+    """
+    record_timestamps = gas_consume.timestamps
+    gas = gas_consume.column("consumed_gas")
+    intervals = {}
+    for timestamp in timestamps:
+        first = max(bisect_left(record_timestamps, timestamp) - 1, 0)
+        last = min(bisect_right(record_timestamps, timestamp), len(gas_consume) - 1)
+        for index in range(first, last):
+            start, end = record_timestamps[index], record_timestamps[index + 1]
+            intervals[start, end] = gas[index + 1] - gas[index]
+    return [(start, end, consumed_gas) for (start, end), consumed_gas in intervals.items()]
+
+
+# Hourly, daily and monthly buckets of metered and estimated gas consumption.
+# Metered consumption is the difference of two readings spread linearly over the time
+# between them; estimated consumption is boiler on-time × the average rate, added when
+# an on-period ends. Both are updated incrementally, so reading a period costs
+# O(buckets) instead of a walk over the records or the recorder history.
+class ConsumptionRollups:
+
+    def __init__(self, hass: HomeAssistant, entry_id, tracker, snapshot):
+        self.hass = hass
+        self._entry_id = entry_id
+        self._tracker = tracker
+        self._snapshot = snapshot
+        self._legacy_store = Store(hass, LEGACY_STORAGE_VERSION, f"{LEGACY_STORAGE_KEY}.{entry_id}")
+        snapshot.register("rollups", self._data_to_save)
+        # period -> {bucket start (UTC epoch): [metered, estimated, on-minutes]}
+        self._buckets = {period: {} for period in PERIODS}
+        self._on_since = None
+        self._unsub = None
+
+    async def async_start(self, data):
+        """
+        Restores the buckets from the snapshot part `data` and follows the boiler.
+        Returns False if there was nothing to restore (see async_rebuild_metered).
+        """
+        if data is None:
+            data = await self._legacy_store.async_load()
+            if data is not None:
+                await self._legacy_store.async_remove()
+        if data:
+            for period in PERIODS:
+                self._buckets[period] = {start: values for start, *values in data[period]}
+            # Close the on-period that was running when the snapshot was taken
+            if data.get("on_since") is not None:
+                self._add_on_period(data["on_since"], data["saved_at"])
+        if self._tracker.is_on:
+            self._on_since = dt_util.utcnow().timestamp()
+        self._unsub = self._tracker.async_add_listener(self._handle_boiler_change)
+        return bool(data)
+
+    @callback
+    def async_stop(self):
+        if self._unsub:
+            self._unsub()
+            self._unsub = None
+
+    def _data_to_save(self):
+        data = {
+            period: [[start, *values] for start, values in sorted(buckets.items())]
+            for period, buckets in self._buckets.items()
+        }
+        data["on_since"] = self._on_since
+        data["saved_at"] = dt_util.utcnow().timestamp()
+        return data
+
+    @callback
+    def _schedule_save(self):
+        self._snapshot.async_schedule_save()
+
+    def _rate(self):
+        return self.hass.data[DOMAIN][self._entry_id].get("average_m3_per_min", DEFAULT_BOILER_AV_M)
+
+    def _add(self, start, end, field, amount):
+        """Spreads `amount` of a field linearly over the buckets between start and end."""
+        spread(self._buckets, start, end, field, amount, dt_util.utcnow().timestamp())
+
+    def _prune(self):
+        now = dt_util.utcnow().timestamp()
+        for period, retention in RETENTION.items():
+            buckets = self._buckets[period]
+            for bucket_start in [start for start in buckets if start < now - retention]:
+                del buckets[bucket_start]
+
+    @callback
+    def _handle_boiler_change(self):
+        now = dt_util.utcnow().timestamp()
+        if self._tracker.is_on:
+            if self._on_since is None:
+                self._on_since = now
+            return
+        if self._on_since is not None:
+            self._add_on_period(self._on_since, now)
+            self._on_since = None
+            self._prune()
+            self._schedule_save()
+
+    def _add_on_period(self, start, end):
+        minutes = (end - start) / 60
+        self._add(start, end, ON_MINUTES, minutes)
+        self._add(start, end, ESTIMATED, minutes * self._rate())
+
+    @callback
+    def replace_intervals(self, old_intervals, new_intervals):
+        """Moves the metered consumption of changed reading intervals (see intervals_around)."""
+        for start, end, consumed_gas in old_intervals:
+            self._add(start, end, METERED, -consumed_gas)
+        for start, end, consumed_gas in new_intervals:
+            self._add(start, end, METERED, consumed_gas)
+        self._prune()
+        self._schedule_save()
+
+    async def async_rebuild_metered(self, gas_consume):
+        """
+        Recomputes the metered consumption of all buckets from the records. The buckets are
+        computed in the executor and swapped in afterwards; the records must not change
+        meanwhile (run it from the meter's WriteQueue).
+        """
+        metered = await self.hass.async_add_executor_job(metered_buckets, gas_consume, dt_util.utcnow().timestamp())
+        for period, buckets in self._buckets.items():
+            for values in buckets.values():
+                values[METERED] = 0.0
+            for bucket_start, values in metered[period].items():
+                buckets.setdefault(bucket_start, [0.0, 0.0, 0.0])[METERED] = values[METERED]
+        self._prune()
+        self._schedule_save()
+
+    def bucket(self, period, timestamp=None):
+        """{"start", "metered", "estimated", "on_minutes"} of the bucket containing `timestamp` (default now)."""
+        now = dt_util.utcnow().timestamp()
+        if timestamp is None:
+            timestamp = now
+        start = bucket_starts(timestamp)[PERIODS.index(period)]
+        metered, estimated, on_minutes = self._buckets[period].get(start, (0.0, 0.0, 0.0))
+        if self._on_since is not None:
+            # The running on-period has not been added yet
+            overlap = min(now, bucket_end(period, start)) - max(self._on_since, start)
+            if overlap > 0:
+                on_minutes += overlap / 60
+                estimated += overlap / 60 * self._rate()
+        return self._as_dict(start, (metered, estimated, on_minutes))
+
+    def query(self, period, start=None, end=None):
+        """Buckets of a period that start between start and end (datetimes, None = open end), oldest first."""
+        low = to_timestamp(start) if start is not None else -math.inf
+        high = to_timestamp(end) if end is not None else math.inf
+        buckets = self._buckets[period]
+        return [
+            self._as_dict(bucket_start, buckets[bucket_start])
+            for bucket_start in sorted(buckets)
+            if low <= bucket_start <= high
+        ]
+
+    def buckets_between(self, period, low, high):
+        """Raw (start, [metered, estimated, on-minutes]) of the buckets with low <= start < high (UTC epochs), oldest first."""
+        buckets = self._buckets[period]
+        return [(start, buckets[start]) for start in sorted(buckets) if low <= start < high]
+
+    @staticmethod
+    def _as_dict(start, values):
+        return {
+            "start": dt_util.as_local(datetime.fromtimestamp(start, timezone.utc)).isoformat(),
+            "metered": round(values[METERED], 4),
+            "estimated": round(values[ESTIMATED], 4),
+            "on_minutes": round(values[ON_MINUTES], 2),
+        }
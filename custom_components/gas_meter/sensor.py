@@ -1,68 +1,312 @@
 import logging
-import asyncio
 
 from datetime import datetime, timedelta
-from homeassistant.const import STATE_UNKNOWN
+from homeassistant.const import STATE_UNKNOWN, EntityCategory, UnitOfTime
 from homeassistant.helpers.typing import ConfigType, DiscoveryInfoType
 from homeassistant.core import HomeAssistant, callback, ServiceCall
 from homeassistant.components.sensor import SensorEntity
-from homeassistant.components.history_stats.sensor import HistoryStatsSensor
-from homeassistant.components.history_stats.coordinator import HistoryStatsUpdateCoordinator, HistoryStats
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
+from homeassistant.helpers.device_registry import DeviceInfo
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
+from homeassistant.helpers.event import async_track_time_change, async_track_time_interval
 from homeassistant.util.dt import now
-from homeassistant.helpers.template import Template
-from .const import DOMAIN, DEFAULT_BOILER_AV_M, DEFAULT_LATEST_GAS_DATA, DEFAULT_BOILER_ENTITY
+from .const import (
+    DOMAIN, signal_gas_data_updated,
+    CONF_RECORDS_WINDOW, CONF_RECORDS_DAYS, DEFAULT_RECORDS_WINDOW, DEFAULT_RECORDS_DAYS
+)
+from .forecast import HORIZON_DAY, HORIZON_WEEK, HORIZON_BILLING, HORIZONS, estimated_reading
+from .gas_consume import format_record
+from .instrumentation import (
+    COUNTER_BYTES_READ, COUNTER_BYTES_WRITTEN, COUNTER_RECORDER_ROWS, TIMING_LOAD, TIMING_SAVE,
+    TIMING_RECORDER, TIMING_RENDER, TIMING_RECORDS_UPDATE, get_metrics
+)
+from .rollups import PERIOD_HOUR, PERIOD_DAY, PERIOD_MONTH
 import custom_components.gas_meter.file_handler as fh
 
 _LOGGER = logging.getLogger(__name__)
 
-class CustomTemplateSensor(SensorEntity):
-    def __init__(self, hass, friendly_name, unique_id, state_template, unit_of_measurement=None, device_class=None, icon=None, state_class=None):
+def _device_info(config_entry):
+    """Groups the entities of one gas meter (config entry)."""
+    return DeviceInfo(
+        identifiers={(DOMAIN, config_entry.entry_id)},
+        name=config_entry.title,
+        manufacturer="Virtual Gas Meter",
+    )
+
+class MeterSensor(SensorEntity):
+    """Base of the meter's entities; their state writes are counted (and timed while profiling)."""
+    _attr_has_entity_name = True
+    _attr_should_poll = False
+
+    def __init__(self, hass: HomeAssistant, config_entry):
         self.hass = hass
-        self._attr_name = friendly_name
-        self._attr_unique_id = unique_id
-        self._state_template = state_template
-        self._attr_unit_of_measurement = unit_of_measurement if unit_of_measurement else "m³"
-        self._attr_device_class = device_class
-        self._attr_icon = icon
-        self._attr_state_class = state_class
-        self._state = None
+        self._entry_id = config_entry.entry_id
+        self._attr_device_info = _device_info(config_entry)
+        self._metrics = get_metrics(hass, config_entry.entry_id)
+
+    @callback
+    def async_write_ha_state(self):
+        with self._metrics.timer(TIMING_RENDER):
+            super().async_write_ha_state()
+        self._metrics.state_written()
+
+class LatestUpdateSensor(MeterSensor):
+    """Timestamp of the latest real meter reading, pushed when a reading is added."""
+    _attr_name = "Gas meter latest update"
+    _attr_icon = "mdi:clock"
+
+    def __init__(self, hass: HomeAssistant, config_entry):
+        super().__init__(hass, config_entry)
+        self._attr_unique_id = f"{config_entry.entry_id}_gas_meter_latest_update"
 
     @property
     def native_value(self):
-        return self._state
+        latest_gas_update = self.hass.data[DOMAIN][self._entry_id].get("latest_gas_update")
+        return str(latest_gas_update) if latest_gas_update else None
 
-    async def async_update(self):
-        try:
-            self._state = await self._async_render_template()
-        except Exception as e:
-            _LOGGER.error("Template rendering failed for %s: %s", self._attr_unique_id, str(e))
-            self._state = "error"
+    async def async_added_to_hass(self):
+        self.async_on_remove(
+            async_dispatcher_connect(self.hass, signal_gas_data_updated(self._entry_id), self.async_write_ha_state)
+        )
+
+class BoilerDrivenSensor(MeterSensor):
+    """Base for estimates pushed when a reading, the rate or the boiler state changes."""
+    _attr_native_unit_of_measurement = "m³"
+    _attr_device_class = "gas"
+    _attr_icon = "mdi:gas-cylinder"
+    _attr_state_class = "total"
+
+    async def async_added_to_hass(self):
+        # The meter's UpdateDispatcher batches changes and refreshes while the boiler is on
+        self.async_on_remove(
+            async_dispatcher_connect(self.hass, signal_gas_data_updated(self._entry_id), self.async_write_ha_state)
+        )
+
+class ConsumedGasSensor(BoilerDrivenSensor):
+    """Latest reading + boiler on-minutes since that reading × average m³/min, pushed on change."""
+    _attr_name = "Consumed gas"
+
+    def __init__(self, hass: HomeAssistant, config_entry):
+        super().__init__(hass, config_entry)
+        self._attr_unique_id = f"{config_entry.entry_id}_consumed_gas"
+
+    @property
+    def native_value(self):
+        return round(estimated_reading(self.hass.data[DOMAIN][self._entry_id], now()), 3)
+
+    @property
+    def extra_state_attributes(self):
+        # Confidence interval of the fitted rate when a rate model other than "cumulative" is used
+        fit = self.hass.data[DOMAIN][self._entry_id].get("rate_fit")
+        if not fit or fit["rate"] is None:
+            return None
+        return {
+            "rate_model": fit["method"],
+            "rate_m3_per_min": fit["rate"],
+            "rate_ci_low": fit["ci_low"],
+            "rate_ci_high": fit["ci_high"],
+        }
+
+class ConsumptionPeriodSensor(BoilerDrivenSensor):
+    """Estimated gas consumption of the current hour, day or month, from the rollup buckets."""
+
+    NAMES = {
+        PERIOD_HOUR: "Gas consumption this hour",
+        PERIOD_DAY: "Gas consumption today",
+        PERIOD_MONTH: "Gas consumption this month",
+    }
 
-    async def _async_render_template(self):
-        template = Template(self._state_template, self.hass)
-        return template.async_render()
+    def __init__(self, hass: HomeAssistant, config_entry, period):
+        super().__init__(hass, config_entry)
+        self._period = period
+        self._attr_name = self.NAMES[period]
+        self._attr_unique_id = f"{config_entry.entry_id}_gas_consumption_{period}"
+
+    def _current_bucket(self):
+        rollups = self.hass.data[DOMAIN][self._entry_id].get("rollups")
+        return rollups.bucket(self._period) if rollups else None
+
+    @property
+    def native_value(self):
+        bucket = self._current_bucket()
+        return round(bucket["estimated"], 3) if bucket else None
+
+    @property
+    def last_reset(self):
+        bucket = self._current_bucket()
+        return datetime.fromisoformat(bucket["start"]) if bucket else None
+
+    @property
+    def extra_state_attributes(self):
+        bucket = self._current_bucket()
+        if not bucket:
+            return None
+        return {"metered": bucket["metered"], "on_minutes": bucket["on_minutes"]}
+
+    async def async_added_to_hass(self):
+        await super().async_added_to_hass()
+        # A new bucket starts every hour
+        self.async_on_remove(
+            async_track_time_change(self.hass, self._handle_hour_start, minute=0, second=0)
+        )
+
+    @callback
+    def _handle_hour_start(self, _now):
+        self.async_write_ha_state()
+
+class ForecastSensor(MeterSensor):
+    """Projected gas consumption of the next day, the next week or the current billing period."""
+    _attr_native_unit_of_measurement = "m³"
+    _attr_device_class = "gas"
+    _attr_icon = "mdi:chart-bell-curve-cumulative"
+
+    NAMES = {
+        HORIZON_DAY: "Gas forecast next 24 hours",
+        HORIZON_WEEK: "Gas forecast next 7 days",
+        HORIZON_BILLING: "Gas forecast billing period",
+    }
+
+    def __init__(self, hass: HomeAssistant, config_entry, horizon):
+        super().__init__(hass, config_entry)
+        self._horizon = horizon
+        self._attr_name = self.NAMES[horizon]
+        self._attr_unique_id = f"{config_entry.entry_id}_gas_forecast_{horizon}"
+
+    def _projection(self):
+        forecaster = self.hass.data[DOMAIN][self._entry_id].get("forecaster")
+        # Cached by the forecaster; all forecast sensors of a batch share one computation
+        return forecaster.forecast()[self._horizon] if forecaster else None
+
+    @property
+    def native_value(self):
+        projection = self._projection()
+        return projection["consumption"] if projection else None
+
+    @property
+    def extra_state_attributes(self):
+        projection = self._projection()
+        if not projection:
+            return None
+        return {key: value for key, value in projection.items() if key != "consumption"}
 
-class GasDataSensor(SensorEntity):
+    async def async_added_to_hass(self):
+        self.async_on_remove(
+            async_dispatcher_connect(self.hass, signal_gas_data_updated(self._entry_id), self.async_write_ha_state)
+        )
+        # The projected window moves on while nothing else changes
+        self.async_on_remove(
+            async_track_time_change(self.hass, self._handle_hour_start, minute=0, second=0)
+        )
+
+    @callback
+    def _handle_hour_start(self, _now):
+        self.async_write_ha_state()
+
+class HeatingIntervalSensor(BoilerDrivenSensor):
+    """
+    Hours the boiler was on since the latest reading, from the in-memory on-time tracker.
+    Written on boiler transitions and new readings, and at the refresh cadence while
+    the boiler is on; no recorder queries.
+    """
+    _attr_name = "Heating Interval"
+    _attr_native_unit_of_measurement = "h"
+    _attr_device_class = "duration"
+    _attr_icon = "mdi:fire"
+    _attr_state_class = "measurement"
+
+    def __init__(self, hass: HomeAssistant, config_entry):
+        super().__init__(hass, config_entry)
+        self._attr_unique_id = f"{config_entry.entry_id}_heating_interval"
+
+    @property
+    def native_value(self):
+        entry_data = self.hass.data[DOMAIN][self._entry_id]
+        latest_gas_update = entry_data.get("latest_gas_update")
+        tracker = entry_data.get("boiler_tracker")
+        if not tracker or not latest_gas_update:
+            return None
+        on_seconds, _missing = tracker.on_seconds_observed(latest_gas_update, now())
+        return round(on_seconds / 3600, 2)
+
+class GasDataSensor(MeterSensor):
     _attr_name = "Gas Consumption Data"
-    _attr_unique_id = "gas_consumption_data"
 
-    def __init__(self, hass: HomeAssistant):
-        self.hass = hass
+    def __init__(self, hass: HomeAssistant, config_entry):
+        super().__init__(hass, config_entry)
+        self._config_entry = config_entry
+        self._attr_unique_id = f"{config_entry.entry_id}_gas_consumption_data"
         self._state = STATE_UNKNOWN
-        self._gas_data = []
+        self._gas_data = None
+        self._revision = None
+        # Formatted rows of the attribute window, keyed by record timestamp
+        self._formatted = {}
+        self._attributes = {}
+
+    def _window_start(self, gas_data):
+        """Index of the first record exposed in the attributes."""
+        options = self._config_entry.options
+        window = options.get(CONF_RECORDS_WINDOW, DEFAULT_RECORDS_WINDOW)
+        days = options.get(CONF_RECORDS_DAYS, DEFAULT_RECORDS_DAYS)
+        start = max(len(gas_data) - window, 0)
+        if days:
+            start = max(start, gas_data.index_at_or_before(now() - timedelta(days=days)) + 1)
+        return start
+
+    def _format_window(self, gas_data):
+        """Formats the attribute window, reusing rows formatted on previous updates."""
+        if gas_data is not self._gas_data or gas_data.revision != self._revision:
+            self._formatted = {}
+        timestamps = gas_data.timestamps
+        last = len(gas_data) - 1
+        formatted = {}
+        for index in range(self._window_start(gas_data), last + 1):
+            timestamp = timestamps[index]
+            row = self._formatted.get(timestamp)
+            # The newest record gets its derived fields after it is added; always refresh it
+            if row is None or index == last:
+                row = format_record(gas_data[index])
+            formatted[timestamp] = row
+        self._formatted = formatted
+        self._gas_data = gas_data
+        self._revision = gas_data.revision
+        return list(formatted.values())
+
+    async def async_added_to_hass(self):
+        self.async_on_remove(
+            async_dispatcher_connect(
+                self.hass, signal_gas_data_updated(self._config_entry.entry_id), self._handle_gas_data_update
+            )
+        )
+
+    @callback
+    def _handle_gas_data_update(self):
+        self.hass.async_create_task(self._async_refresh())
+
+    async def _async_refresh(self):
+        # async_schedule_update_ha_state would bypass async_write_ha_state (and its counting)
+        await self.async_update()
+        self.async_write_ha_state()
 
     async def async_update(self):
+        with self._metrics.timer(TIMING_RECORDS_UPDATE):
+            await self._async_update_records()
+
+    async def _async_update_records(self):
         try:
-            self._gas_data = await fh.load_gas_actualdata(self.hass)
-            if self._gas_data:
+            gas_data = await fh.async_get_gas_consume(self.hass, self._config_entry.entry_id)
+            if gas_data:
                 # Format the last record (most recent)
-                latest_record = self._gas_data[-1]
+                latest_record = gas_data[-1]
                 formatted_datetime = latest_record["datetime"].strftime('%Y-%m-%d %H:%M:%S')
                 formatted_gas = f"{latest_record['consumed_gas']:.2f} m³"
                 self._state = f"Last record: {formatted_datetime}, consumed gas: {formatted_gas}"
+                self._attributes = {
+                    "records": self._format_window(gas_data),
+                    "records_total": len(gas_data),
+                }
             else:
                 self._state = STATE_UNKNOWN
+                self._attributes = {}
         except Exception as e:
             _LOGGER.error("Error updating gas sensor: %s", str(e))
             self._state = STATE_UNKNOWN
@@ -73,105 +317,115 @@ class GasDataSensor(SensorEntity):
 
     @property
     def extra_state_attributes(self):
-        if self._gas_data:
-            # Format all records for more user-friendly display on dashboard
-            formatted_records = []
-            for record in self._gas_data:
-                formatted_datetime = record["datetime"].strftime('%Y-%m-%d %H:%M:%S')
-                formatted_gas = f"{record['consumed_gas']:.3f} m³"
-                formatted_cumulative = f"{record.get('consumed_gas_cumulated', 0):.3f} m³"
-                formatted_record = {
-                    "datetime": formatted_datetime,
-                    "consumed_gas": formatted_gas,
-                    "consumed_gas_cumulated": formatted_cumulative,
-                }
-                formatted_records.append(formatted_record)
+        # Only a bounded window of the latest records is exposed; older records
+        # are available through the gas_meter.get_records service.
+        return self._attributes
 
-            return {"records": formatted_records}
-        return {}
+class DiagnosticSensor(SensorEntity):
+    """Base of the optional (disabled by default) metric sensors, refreshed every minute."""
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_entity_registry_enabled_default = False
+    _attr_has_entity_name = True
+    _attr_should_poll = False
 
-class CustomHistoryStatsSensor(HistoryStatsSensor):
-    def __init__(self, entity_id, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.entity_id = entity_id
+    def __init__(self, hass: HomeAssistant, config_entry, key):
+        self.hass = hass
+        self._entry_id = config_entry.entry_id
+        self._attr_unique_id = f"{config_entry.entry_id}_metric_{key}"
+        self._attr_device_info = _device_info(config_entry)
+        self._metrics = get_metrics(hass, config_entry.entry_id)
 
-    async def async_update(self):
-        await self.coordinator.async_request_refresh()
+    async def async_added_to_hass(self):
+        # Only enabled entities get here, so disabled ones cost nothing
+        self.async_on_remove(
+            async_track_time_interval(self.hass, self._handle_refresh, timedelta(minutes=1))
+        )
 
+    @callback
+    def _handle_refresh(self, _now):
+        self.async_write_ha_state()
 
+class TimingSensor(DiagnosticSensor):
+    """Latest duration of a timed hot path (collected while profiling is on)."""
+    _attr_native_unit_of_measurement = UnitOfTime.MILLISECONDS
+    _attr_device_class = "duration"
+    _attr_state_class = "measurement"
+    _attr_icon = "mdi:timer-outline"
 
-async def async_setup_entry(hass: HomeAssistant, config_entry, async_add_entities: AddEntitiesCallback):
-    """Set up the sensor platform and add the entities."""
-    sensors = [
-        CustomTemplateSensor(
-            hass=hass,
-            friendly_name="Consumed gas",
-            unique_id="consumed_gas",
-            state_template=f"{{{{ (states('{DOMAIN}.latest_gas_data') | float({DEFAULT_LATEST_GAS_DATA}) + (states('sensor.heating_interval_2') | float(0) * states('{DOMAIN}.average_m3_per_min') | float({DEFAULT_BOILER_AV_M})) | round(3)) }}}}",
-            unit_of_measurement="m³",
-            device_class="gas",
-            icon="mdi:gas-cylinder",
-            state_class="total",
-        ),
-        CustomTemplateSensor(
-            hass=hass,
-            friendly_name="Gas meter latest update",
-            unique_id="gas_meter_latest_update",
-            state_template=f"{{{{ states('{DOMAIN}.latest_gas_update') if states('{DOMAIN}.latest_gas_update') not in ['unknown', 'unavailable', None] }}}}",
-            icon="mdi:clock",
-        ),
-    ]
+    # timing: (name, counter shown with it)
+    TIMINGS = {
+        TIMING_LOAD: ("Log load time", COUNTER_BYTES_READ),
+        TIMING_SAVE: ("Log save time", COUNTER_BYTES_WRITTEN),
+        TIMING_RECORDER: ("Recorder query time", COUNTER_RECORDER_ROWS),
+        TIMING_RENDER: ("State render time", None),
+        TIMING_RECORDS_UPDATE: ("Records update time", None),
+    }
 
-    async_add_entities([GasDataSensor(hass)], True)
-    async_add_entities(sensors, update_before_add=True)
+    def __init__(self, hass: HomeAssistant, config_entry, timing):
+        super().__init__(hass, config_entry, timing)
+        self._timing = timing
+        self._attr_name, self._counter = self.TIMINGS[timing]
 
-    async def create_history_stats_sensor(hass: HomeAssistant, config_entry):
-        start_template = Template("{{ states('sensor.gas_meter_latest_update') }}", hass)
-        end_template = Template("{{ now() }}", hass)
+    @property
+    def native_value(self):
+        timing = self._metrics.timing(self._timing)
+        return timing["last_ms"] if timing else None
 
-        boiler_entity = hass.states.get(f"{DOMAIN}.boiler_entity")
-        boiler_entity_id = boiler_entity.state if boiler_entity and boiler_entity.state else DEFAULT_BOILER_ENTITY
+    @property
+    def extra_state_attributes(self):
+        attributes = dict(self._metrics.timing(self._timing) or {}, profiling=self._metrics.profiling)
+        if self._counter:
+            attributes[self._counter] = self._metrics.counter(self._counter)
+        return attributes
 
-        history_stats = HistoryStats(
-            hass=hass,
-            entity_id=boiler_entity_id,
-            entity_states=["on"],
-            start=start_template,
-            end=end_template,
-            duration=None,
-        )
+class RecordCountSensor(DiagnosticSensor):
+    """Number of records in the meter's log."""
+    _attr_name = "Gas records"
+    _attr_state_class = "measurement"
+    _attr_icon = "mdi:database"
 
-        coordinator = HistoryStatsUpdateCoordinator(
-            hass=hass,
-            history_stats=history_stats,
-            config_entry=config_entry,
-            name="Heating Interval"
-        )
+    def __init__(self, hass: HomeAssistant, config_entry):
+        super().__init__(hass, config_entry, "records")
+
+    @property
+    def native_value(self):
+        # Only the cached copy; this sensor never loads the log itself
+        gas_consume = self.hass.data[DOMAIN][self._entry_id].get("gas_consume")
+        return len(gas_consume) if gas_consume is not None else None
 
-        await coordinator.async_refresh()
+class StateWritesSensor(DiagnosticSensor):
+    """State writes of the meter's entities over the last minute."""
+    _attr_name = "State writes per minute"
+    _attr_native_unit_of_measurement = "writes/min"
+    _attr_state_class = "measurement"
+    _attr_icon = "mdi:pencil"
 
-        history_stats_sensor = CustomHistoryStatsSensor(
-            entity_id = "sensor.heating_interval",
-            hass=hass,
-            name="Heating Interval",
-            source_entity_id=boiler_entity_id,
-            sensor_type="time",
-            unique_id="heating_interval",
-            coordinator=coordinator
-        )
+    def __init__(self, hass: HomeAssistant, config_entry):
+        super().__init__(hass, config_entry, "state_writes")
 
-        @callback
-        def _handle_coordinator_update():
-            """Handle updated data from the coordinator."""
-            if history_stats_sensor.hass is None:
-                _LOGGER.warning("Skipping update: hass is not available for %s", history_stats_sensor.name)
-                return
+    @property
+    def native_value(self):
+        return self._metrics.state_writes_per_minute
 
-            history_stats_sensor._attr_state = coordinator.data
-            history_stats_sensor.async_write_ha_state()
+    @property
+    def extra_state_attributes(self):
+        return {"total": self._metrics.state_writes}
 
-        coordinator.async_add_listener(_handle_coordinator_update)
-        async_add_entities([history_stats_sensor], update_before_add=True)
-        _LOGGER.info("Heating Interval sensor added successfully.")
+async def async_setup_entry(hass: HomeAssistant, config_entry, async_add_entities: AddEntitiesCallback):
+    """Set up the sensor platform and add the entities of one gas meter."""
+    sensors = [
+        ConsumedGasSensor(hass, config_entry),
+        LatestUpdateSensor(hass, config_entry),
+        HeatingIntervalSensor(hass, config_entry),
+    ]
+    sensors.extend(
+        ConsumptionPeriodSensor(hass, config_entry, period) for period in (PERIOD_HOUR, PERIOD_DAY, PERIOD_MONTH)
+    )
+    sensors.extend(ForecastSensor(hass, config_entry, horizon) for horizon in HORIZONS)
 
-    asyncio.create_task(create_history_stats_sensor(hass, config_entry))
+    # The records sensor is filled once the log has been read after setup
+    async_add_entities([GasDataSensor(hass, config_entry)])
+    diagnostics = [RecordCountSensor(hass, config_entry), StateWritesSensor(hass, config_entry)]
+    diagnostics.extend(TimingSensor(hass, config_entry, timing) for timing in TimingSensor.TIMINGS)
+    async_add_entities(diagnostics)
+    async_add_entities(sensors, update_before_add=True)
@@ -0,0 +1,41 @@
+import logging
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.storage import Store
+from .const import DOMAIN
+
+_LOGGER = logging.getLogger(__name__)
+
+STORAGE_VERSION = 1
+STORAGE_KEY = f"{DOMAIN}.snapshot"
+# Snapshots are written at most this often (seconds) and always on unload/shutdown.
+SAVE_DELAY = 60
+
+
+# Compact snapshot of one meter's derived state: the latest reading and rate, the boiler
+# on-time tracker and the consumption rollups. It is restored with a single small read
+# at startup, so the entities have their values before the record log is touched.
+# Every component registers a part (a name and a function returning its data).
+class MeterSnapshot:
+
+    def __init__(self, hass: HomeAssistant, entry_id):
+        self.hass = hass
+        self._store = Store(hass, STORAGE_VERSION, f"{STORAGE_KEY}.{entry_id}")
+        self._parts = {}
+
+    async def async_load(self):
+        """Returns the saved parts ({} if there is no snapshot yet)."""
+        return await self._store.async_load() or {}
+
+    @callback
+    def register(self, name, data_func):
+        self._parts[name] = data_func
+
+    def _collect(self):
+        return {name: data_func() for name, data_func in self._parts.items()}
+
+    @callback
+    def async_schedule_save(self):
+        self._store.async_delay_save(self._collect, SAVE_DELAY)
+
+    async def async_save(self):
+        await self._store.async_save(self._collect())
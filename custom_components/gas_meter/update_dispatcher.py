@@ -0,0 +1,88 @@
+import logging
+from datetime import timedelta
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.debounce import Debouncer
+from homeassistant.helpers.dispatcher import async_dispatcher_send
+from homeassistant.helpers.event import async_track_time_interval
+from .const import signal_gas_data_updated
+
+_LOGGER = logging.getLogger(__name__)
+
+
+# Single fan-out point for the state writes of one meter.
+# Every change (a reading, a new rate, a boiler transition) only schedules an update;
+# all changes within the debounce window are sent as one signal, so each entity
+# writes its state at most once per batch. While the boiler is on, the live estimates
+# are refreshed by one timer for all entities.
+class UpdateDispatcher:
+
+    def __init__(self, hass: HomeAssistant, entry_id, tracker, debounce, refresh_interval):
+        self.hass = hass
+        self._entry_id = entry_id
+        self._tracker = tracker
+        self._refresh_interval = timedelta(seconds=refresh_interval)
+        self._debouncer = Debouncer(hass, _LOGGER, cooldown=debounce, immediate=False, function=self._flush)
+        self._unsub_tracker = None
+        self._unsub_refresh = None
+        # Scheduled updates and the batches they were coalesced into
+        self.requests = 0
+        self.batches = 0
+
+    @property
+    def stats(self):
+        """Scheduled updates, the batches (signals) they were coalesced into and the refresh state."""
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "refreshing": self._unsub_refresh is not None,
+        }
+
+    @callback
+    def async_start(self):
+        self._unsub_tracker = self._tracker.async_add_listener(self._handle_boiler_change)
+        self._update_refresh()
+
+    @callback
+    def async_stop(self):
+        if self._unsub_tracker:
+            self._unsub_tracker()
+            self._unsub_tracker = None
+        self._stop_refresh()
+        self._debouncer.async_shutdown()
+
+    @callback
+    def async_schedule(self):
+        """Requests an update of all entities of the meter in the next batch."""
+        self.requests += 1
+        self._debouncer.async_schedule_call()
+
+    @callback
+    def _flush(self):
+        self.batches += 1
+        async_dispatcher_send(self.hass, signal_gas_data_updated(self._entry_id))
+
+    @callback
+    def _handle_boiler_change(self):
+        self._update_refresh()
+        self.async_schedule()
+
+    @callback
+    def _update_refresh(self):
+        """Runs the periodic refresh only while the boiler is on."""
+        if self._tracker.is_on:
+            if self._unsub_refresh is None:
+                self._unsub_refresh = async_track_time_interval(
+                    self.hass, self._handle_refresh, self._refresh_interval
+                )
+        else:
+            self._stop_refresh()
+
+    @callback
+    def _handle_refresh(self, _now):
+        self._flush()
+
+    @callback
+    def _stop_refresh(self):
+        if self._unsub_refresh:
+            self._unsub_refresh()
+            self._unsub_refresh = None
@@ -0,0 +1,102 @@
+import logging
+import time
+from collections import deque
+from homeassistant.core import HomeAssistant
+
+_LOGGER = logging.getLogger(__name__)
+
+_READINGS = "readings"
+_JOB = "job"
+
+
+# Serializes all mutations of one meter's records.
+# Callers queue readings (or an exclusive job) and wait for the result. A single worker
+# drains the queue; readings queued back to back are merged into one batch, so overlapping
+# calls share one recompute and one save instead of racing on the same snapshot.
+class WriteQueue:
+
+    def __init__(self, hass: HomeAssistant, entry_id, apply_readings):
+        self.hass = hass
+        self._entry_id = entry_id
+        # Coroutine function applying a list of (datetime, consumed_gas) readings
+        self._apply_readings = apply_readings
+        self._pending = deque()
+        self._worker = None
+        self.processed = 0
+        self.batches = 0
+        self.max_depth = 0
+        self.last_latency = None
+        self.max_latency = 0.0
+        self._total_latency = 0.0
+
+    @property
+    def depth(self):
+        """Number of queued, not yet applied items."""
+        return len(self._pending)
+
+    @property
+    def stats(self):
+        """Queue depth and latency (seconds from queuing to completion)."""
+        return {
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "processed": self.processed,
+            "batches": self.batches,
+            "last_latency": self.last_latency,
+            "max_latency": self.max_latency,
+            "mean_latency": self._total_latency / self.processed if self.processed else None,
+        }
+
+    async def async_add_readings(self, readings):
+        """Adds or corrects readings; returns the result of apply_readings for their batch."""
+        return await self._async_submit(_READINGS, list(readings))
+
+    async def async_run(self, job):
+        """Runs the coroutine function `job` with no other mutation in progress."""
+        return await self._async_submit(_JOB, job)
+
+    async def _async_submit(self, kind, payload):
+        future = self.hass.loop.create_future()
+        self._pending.append((kind, payload, future, time.monotonic()))
+        self.max_depth = max(self.max_depth, len(self._pending))
+        if self._worker is None or self._worker.done():
+            self._worker = self.hass.async_create_task(self._async_drain())
+        return await future
+
+    async def _async_drain(self):
+        while self._pending:
+            batch = [self._pending.popleft()]
+            kind, payload = batch[0][0], batch[0][1]
+            if kind == _READINGS:
+                while self._pending and self._pending[0][0] == _READINGS:
+                    batch.append(self._pending.popleft())
+                readings = [reading for _kind, batch_readings, _future, _queued in batch for reading in batch_readings]
+                work = self._apply_readings(readings)
+            else:
+                work = payload()
+
+            try:
+                result = await work
+            except Exception as err:  # Handed to every caller of the batch
+                for _kind, _payload, future, _queued in batch:
+                    if not future.done():
+                        future.set_exception(err)
+            else:
+                for _kind, _payload, future, _queued in batch:
+                    if not future.done():
+                        future.set_result(result)
+            self._record(batch)
+
+    def _record(self, batch):
+        now = time.monotonic()
+        for _kind, _payload, _future, queued in batch:
+            latency = now - queued
+            self._total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+            self.last_latency = latency
+        self.processed += len(batch)
+        self.batches += 1
+        _LOGGER.debug(
+            "Applied %d queued item(s) of %s in one batch (%.1f ms after queuing, %d still queued)",
+            len(batch), self._entry_id, self.last_latency * 1000, len(self._pending),
+        )
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# custom_components/ is imported from the repository root, as Home Assistant does from its config directory
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
@@ -0,0 +1,118 @@
+import asyncio
+from datetime import timedelta
+from pathlib import Path
+from types import SimpleNamespace
+import pytest
+from homeassistant.util import dt as dt_util
+import custom_components.gas_meter as gas_meter
+import custom_components.gas_meter.boiler_tracker as boiler_tracker
+from custom_components.gas_meter.boiler_tracker import BoilerOnTimeTracker
+from custom_components.gas_meter.const import DOMAIN
+from custom_components.gas_meter.forecast import ConsumptionForecaster
+from custom_components.gas_meter.rollups import ConsumptionRollups
+
+ENTRY_ID = "test"
+BOILER = "switch.boiler"
+HOUR = 3600
+
+
+class StandInSnapshot:
+
+    def register(self, name, data_func):
+        pass
+
+    def async_schedule_save(self):
+        pass
+
+
+class StandInUpdates:
+
+    def async_schedule(self):
+        pass
+
+
+def _hass(config_dir):
+    async def async_add_executor_job(target, *args):
+        return target(*args)
+
+    Path(config_dir, "custom_components", DOMAIN).mkdir(parents=True)
+    entry = SimpleNamespace(entry_id=ENTRY_ID, options={})
+    return SimpleNamespace(
+        data={},
+        config=SimpleNamespace(config_dir=str(config_dir), path=lambda *parts: str(Path(config_dir, *parts))),
+        config_entries=SimpleNamespace(async_get_entry=lambda entry_id: entry),
+        async_add_executor_job=async_add_executor_job,
+    )
+
+
+async def _meter(config_dir, now):
+    """A meter with readings 4, 3 and 1 hours ago; the boiler switched every 30 minutes for the last 5 hours."""
+    hass = _hass(config_dir)
+    snapshot = StandInSnapshot()
+    tracker = BoilerOnTimeTracker(hass, ENTRY_ID, BOILER, snapshot)
+    for index, timestamp in enumerate(range(int(now) - 5 * HOUR, int(now), HOUR // 2)):
+        tracker._append(timestamp, index % 2 == 0)
+    rollups = ConsumptionRollups(hass, ENTRY_ID, tracker, snapshot)
+    hass.data[DOMAIN] = {ENTRY_ID: {
+        "snapshot": snapshot, "boiler_tracker": tracker, "rollups": rollups, "updates": StandInUpdates(),
+        "forecaster": ConsumptionForecaster(hass, ENTRY_ID, rollups, tracker),
+    }}
+    for hours_ago, consumed_gas in ((4, 100.0), (3, 101.0), (1, 102.0)):
+        when = dt_util.utc_from_timestamp(now - hours_ago * HOUR)
+        await gas_meter._async_apply_readings(hass, ENTRY_ID, [(when, consumed_gas)])
+    return hass
+
+
+def _on_time_since_latest(hass, now):
+    entry_data = hass.data[DOMAIN][ENTRY_ID]
+    return entry_data["boiler_tracker"].on_seconds_observed(entry_data["latest_gas_update"], dt_util.utc_from_timestamp(now))
+
+
+@pytest.fixture
+def recorder(monkeypatch):
+    """Recorded boiler states: on during the first quarter of every hour."""
+    queries = []
+
+    async def async_recorder_transitions(hass, entity_id, start_time, end_time, metrics=None):
+        queries.append((start_time, end_time))
+        start = int(start_time.timestamp()) // HOUR * HOUR
+        transitions = []
+        for hour in range(start, int(end_time.timestamp()), HOUR):
+            transitions.extend([(max(hour, start_time.timestamp()), True), (hour + HOUR // 4, False)])
+        return [transition for transition in transitions if transition[0] < end_time.timestamp()]
+
+    monkeypatch.setattr(boiler_tracker, "async_recorder_transitions", async_recorder_transitions)
+    return queries
+
+
+def test_delete_latest_reading_keeps_on_time(tmp_path, recorder):
+    now = (dt_util.utcnow().timestamp() // HOUR) * HOUR
+
+    async def run():
+        hass = await _meter(tmp_path, now)
+        await gas_meter._async_delete_reading(hass, ENTRY_ID, dt_util.utc_from_timestamp(now - HOUR))
+        return hass
+
+    hass = asyncio.run(run())
+
+    assert hass.data[DOMAIN][ENTRY_ID]["latest_gas_update"] == dt_util.utc_from_timestamp(now - 3 * HOUR)
+    # On every other half hour of the 3 hours since the reading before it, all observed
+    assert _on_time_since_latest(hass, now) == (1.5 * HOUR, [])
+    assert recorder == []
+
+
+def test_delete_two_latest_readings_fills_from_recorder(tmp_path, recorder):
+    now = (dt_util.utcnow().timestamp() // HOUR) * HOUR
+
+    async def run():
+        hass = await _meter(tmp_path, now)
+        await gas_meter._async_delete_reading(hass, ENTRY_ID, dt_util.utc_from_timestamp(now - HOUR))
+        await gas_meter._async_delete_reading(hass, ENTRY_ID, dt_util.utc_from_timestamp(now - 3 * HOUR))
+        return hass
+
+    hass = asyncio.run(run())
+
+    assert hass.data[DOMAIN][ENTRY_ID]["latest_gas_update"] == dt_util.utc_from_timestamp(now - 4 * HOUR)
+    # The pruned hour comes from the recorder (a quarter of it on), the rest was observed
+    assert _on_time_since_latest(hass, now) == (0.25 * HOUR + 1.5 * HOUR, [])
+    assert len(recorder) == 1
@@ -0,0 +1,71 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from types import SimpleNamespace
+import pytest
+from homeassistant.exceptions import ServiceValidationError
+from custom_components.gas_meter import _async_resolve_path
+from custom_components.gas_meter.const import EXPORT_DIRECTORY
+from custom_components.gas_meter.export import EXPORT_CSV, export_records
+from custom_components.gas_meter.gas_consume import GasConsume
+
+START = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+def _hass(config_dir, allowed=()):
+    async def async_add_executor_job(target, *args):
+        return target(*args)
+
+    config = SimpleNamespace(
+        config_dir=str(config_dir),
+        path=lambda *parts: str(Path(config_dir, *parts)),
+        is_allowed_path=lambda path: any(Path(path).resolve().is_relative_to(directory) for directory in allowed),
+    )
+    return SimpleNamespace(config=config, async_add_executor_job=async_add_executor_job)
+
+
+def _records():
+    return GasConsume(
+        [{"datetime": START + timedelta(hours=hour), "consumed_gas": 100.0 + hour} for hour in range(3)]
+    )
+
+
+def test_export_path_inside_export_directory(tmp_path):
+    path = asyncio.run(_async_resolve_path(_hass(tmp_path), f"{EXPORT_DIRECTORY}/heating.csv", EXPORT_DIRECTORY))
+
+    assert path == tmp_path / EXPORT_DIRECTORY / "heating.csv"
+
+
+@pytest.mark.parametrize(
+    "path",
+    ["configuration.yaml", ".storage/core.config_entries", f"{EXPORT_DIRECTORY}/../secrets.yaml", "/etc/passwd"],
+)
+def test_export_path_outside_export_directory(tmp_path, path):
+    with pytest.raises(ServiceValidationError):
+        asyncio.run(_async_resolve_path(_hass(tmp_path), path, EXPORT_DIRECTORY))
+
+
+def test_export_path_allowlisted(tmp_path):
+    allowed = tmp_path / "exports"
+    allowed.mkdir()
+    hass = _hass(tmp_path / "config", allowed=(allowed,))
+
+    assert asyncio.run(_async_resolve_path(hass, str(allowed / "heating.csv"), EXPORT_DIRECTORY)) == allowed / "heating.csv"
+
+
+def test_export_writes_new_file(tmp_path):
+    path = tmp_path / EXPORT_DIRECTORY / "heating.csv"
+
+    assert export_records(_records(), path, EXPORT_CSV) == 3
+    assert path.read_text().splitlines()[0].startswith("datetime,consumed_gas,")
+    assert [file.name for file in path.parent.iterdir()] == ["heating.csv"]
+
+
+def test_export_keeps_existing_file(tmp_path):
+    path = tmp_path / "configuration.yaml"
+    path.write_text("homeassistant:\n")
+
+    with pytest.raises(FileExistsError):
+        export_records(_records(), path, EXPORT_CSV)
+    assert path.read_text() == "homeassistant:\n"
+    assert [file.name for file in tmp_path.iterdir()] == ["configuration.yaml"]
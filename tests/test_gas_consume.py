@@ -0,0 +1,78 @@
+import math
+from datetime import datetime, timedelta, timezone
+import pytest
+from custom_components.gas_meter.gas_consume import GasConsume
+
+START = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+def _history():
+    """Readings 100/110/130/160 with 10/20/30 boiler on-minutes in between."""
+    gas_consume = GasConsume(
+        [{"datetime": START + timedelta(hours=hour), "consumed_gas": gas} for hour, gas in enumerate((100, 110, 130, 160))]
+    )
+    gas_consume.recompute(0, {1: 10.0, 2: 20.0, 3: 30.0})
+    return gas_consume
+
+
+def _column(gas_consume, key):
+    return [None if math.isnan(value) else round(value, 6) for value in gas_consume.column(key)]
+
+
+def test_recompute():
+    gas_consume = _history()
+
+    assert _column(gas_consume, "min_cumulated") == [None, 10.0, 30.0, 60.0]
+    assert _column(gas_consume, "m3/min for interval") == [None, 1.0, 1.0, 1.0]
+    assert _column(gas_consume, "average m3/min") == [None, 1.0, 1.0, 1.0]
+
+
+def test_delete_first_record():
+    gas_consume = _history()
+
+    index = gas_consume.delete(START)
+    gas_consume.recompute(index)
+
+    assert _column(gas_consume, "min_cumulated") == [None, 20.0, 50.0]
+    assert _column(gas_consume, "m3/min for interval") == [None, 1.0, 1.0]
+    assert _column(gas_consume, "consumed_gas_cumulated") == [None, 20.0, 50.0]
+    assert _column(gas_consume, "average m3/min") == [None, 1.0, 1.0]
+
+
+def test_delete_middle_record_merges_intervals():
+    gas_consume = _history()
+
+    index = gas_consume.delete(START + timedelta(hours=1))
+    gas_consume.recompute(index)
+
+    assert _column(gas_consume, "min_cumulated") == [None, 30.0, 60.0]
+    assert _column(gas_consume, "m3/min for interval") == [None, 1.0, 1.0]
+
+
+@pytest.mark.parametrize("merge", [False, True])
+def test_insert_before_first_record(merge):
+    gas_consume = _history()
+
+    reading = (START - timedelta(hours=1), 95.0)
+    if merge:
+        first_changed, stale = gas_consume.merge_readings([reading])
+    else:
+        first_changed, stale = gas_consume.upsert(*reading)
+    assert (first_changed, stale) == (0, [1])
+    gas_consume.recompute(first_changed, {1: 5.0})
+
+    assert _column(gas_consume, "min_cumulated") == [None, 5.0, 15.0, 35.0, 65.0]
+    assert _column(gas_consume, "m3/min for interval") == [None, 1.0, 1.0, 1.0, 1.0]
+    assert _column(gas_consume, "consumed_gas_cumulated") == [None, 5.0, 15.0, 35.0, 65.0]
+
+
+def test_merge_readings_at_the_end_keeps_the_history():
+    gas_consume = _history()
+
+    first_changed, stale = gas_consume.merge_readings(
+        [(START + timedelta(hours=5), 200.0), (START + timedelta(hours=4), 180.0)]
+    )
+
+    assert (first_changed, stale) == (4, [4, 5])
+    assert list(gas_consume.column("consumed_gas")) == [100.0, 110.0, 130.0, 160.0, 180.0, 200.0]
+    assert _column(gas_consume, "min_cumulated")[:4] == [None, 10.0, 30.0, 60.0]
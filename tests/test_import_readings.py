@@ -0,0 +1,61 @@
+import asyncio
+from pathlib import Path
+from types import SimpleNamespace
+import pytest
+from homeassistant.exceptions import ServiceValidationError
+import custom_components.gas_meter.file_handler as fh
+from custom_components.gas_meter import _async_resolve_path
+from custom_components.gas_meter.const import EXPORT_DIRECTORY, IMPORT_DIRECTORY
+
+
+def _hass(config_dir):
+    async def async_add_executor_job(target, *args):
+        return target(*args)
+
+    config = SimpleNamespace(
+        config_dir=str(config_dir),
+        path=lambda *parts: str(Path(config_dir, *parts)),
+        is_allowed_path=lambda path: False,
+    )
+    return SimpleNamespace(config=config, async_add_executor_job=async_add_executor_job)
+
+
+def _resolve(config_dir, path):
+    return asyncio.run(_async_resolve_path(_hass(config_dir), path, IMPORT_DIRECTORY, EXPORT_DIRECTORY))
+
+
+def test_import_path_inside_import_or_export_directory(tmp_path):
+    assert _resolve(tmp_path, f"{IMPORT_DIRECTORY}/readings.csv") == tmp_path / IMPORT_DIRECTORY / "readings.csv"
+    assert _resolve(tmp_path, f"{EXPORT_DIRECTORY}/export.csv") == tmp_path / EXPORT_DIRECTORY / "export.csv"
+
+
+@pytest.mark.parametrize("path", ["secrets.yaml", f"{IMPORT_DIRECTORY}/../secrets.yaml", ".storage/auth"])
+def test_import_path_outside_import_directories(tmp_path, path):
+    with pytest.raises(ServiceValidationError):
+        _resolve(tmp_path, path)
+
+
+def test_csv_error_names_the_line_not_the_values(tmp_path):
+    path = tmp_path / "readings.csv"
+    path.write_text("datetime,consumed_gas\n2025-01-01 00:00,100.5\n\nmqtt_password: s3cr3t,x\n")
+
+    with pytest.raises(ValueError) as error:
+        fh.read_readings_file(path)
+
+    assert str(error.value) == "row 4 is not a valid reading (datetime, consumed_gas)"
+    assert "s3cr3t" not in str(error.value)
+
+
+def test_json_error_names_the_position(tmp_path):
+    path = tmp_path / "readings.json"
+    path.write_text('[{"datetime": "2025-01-01 00:00", "consumed_gas": 100.5}, {"datetime": "s3cr3t", "consumed_gas": 1}]')
+
+    with pytest.raises(ValueError, match="^row 2 is not a valid reading"):
+        fh.read_readings_file(path)
+
+
+def test_csv_readings(tmp_path):
+    path = tmp_path / "readings.csv"
+    path.write_text("datetime,consumed_gas\n2025-01-01 00:00,100.5\n2025-01-02 00:00,101\n")
+
+    assert [consumed_gas for _when, consumed_gas in fh.read_readings_file(path)] == [100.5, 101.0]
@@ -0,0 +1,78 @@
+import pickle
+import struct
+import zlib
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+import pytest
+from custom_components.gas_meter import file_handler as fh
+from custom_components.gas_meter.gas_consume import GasConsume, to_timestamp
+from custom_components.gas_meter.record_format import legacy_loads, read_legacy_log, read_log
+
+# Installs write local (ZoneInfo) datetimes, e.g. dt_util.now() for the first record
+TZ = ZoneInfo("Europe/Warsaw")
+START = datetime(2025, 1, 1, 6, 0, tzinfo=TZ)
+
+
+def _records(count=3):
+    return [{"datetime": START + timedelta(days=day), "consumed_gas": 100.0 + day} for day in range(count)]
+
+
+def _frame(record):
+    payload = pickle.dumps(record)
+    return struct.pack("<II", len(payload), zlib.crc32(payload)) + payload
+
+
+@pytest.mark.parametrize("protocol", [2, pickle.DEFAULT_PROTOCOL, pickle.HIGHEST_PROTOCOL])
+def test_legacy_pickle_with_zoneinfo_datetimes(monkeypatch, protocol):
+    # The GasConsume(UserList) of the first versions pickled as its class and {"data": records}
+    records = _records()
+    monkeypatch.setattr(GasConsume, "__getstate__", lambda self: {"data": records})
+    data = pickle.dumps(GasConsume.__new__(GasConsume), protocol=protocol)
+    monkeypatch.undo()
+
+    gas_consume = legacy_loads(data)
+
+    assert isinstance(gas_consume, GasConsume)
+    assert [record["consumed_gas"] for record in gas_consume] == [100.0, 101.0, 102.0]
+    assert gas_consume.timestamps[0] == to_timestamp(START)
+
+
+def test_legacy_pickle_refuses_other_getattr():
+    class Payload:
+        def __reduce__(self):
+            return getattr, (dict, "fromkeys")
+
+    with pytest.raises(pickle.UnpicklingError):
+        legacy_loads(pickle.dumps(Payload()))
+
+
+def test_migrate_pickled_frame_log(tmp_path):
+    records = _records()
+    deleted = dict(records[1], deleted=True)
+    pickle_log = tmp_path / "gas_actualdata_entry.log"
+    pickle_log.write_bytes(b"".join(_frame(record) for record in records + [deleted]))
+    assert [record["consumed_gas"] for record in read_legacy_log(pickle_log.read_bytes())] == [100.0, 102.0]
+
+    path = tmp_path / "gas_actualdata_entry.bin"
+    assert fh._migrate_pickle_log(pickle_log, path) == 2
+    with open(path, "rb") as file:
+        timestamps, columns, _fields, _frames, _size = read_log(file)
+    assert list(timestamps) == [to_timestamp(records[0]["datetime"]), to_timestamp(records[2]["datetime"])]
+    assert list(columns["consumed_gas"]) == [100.0, 102.0]
+    assert pickle_log.with_suffix(".log.migrated").exists()
+
+
+def test_migrate_pickled_file(monkeypatch, tmp_path):
+    records = _records()
+    monkeypatch.setattr(GasConsume, "__getstate__", lambda self: {"data": records})
+    legacy_path = tmp_path / "gas_actualdata.pkl"
+    legacy_path.write_bytes(pickle.dumps(GasConsume.__new__(GasConsume)))
+    monkeypatch.undo()
+
+    path = tmp_path / "gas_actualdata_entry.bin"
+    assert fh._migrate_pickle_file(legacy_path, path) == 3
+    with open(path, "rb") as file:
+        _timestamps, columns, _fields, _frames, _size = read_log(file)
+    assert list(columns["consumed_gas"]) == [100.0, 101.0, 102.0]
+    assert legacy_path.with_suffix(".pkl.migrated").exists()
+    assert fh._migrate_pickle_file(legacy_path, path) is None
@@ -0,0 +1,72 @@
+import math
+from array import array
+from datetime import datetime, timedelta, timezone
+from custom_components.gas_meter import file_handler as fh
+from custom_components.gas_meter.gas_consume import FIELDS, GasConsume
+from custom_components.gas_meter.record_format import read_log, write_base
+
+START = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+def _write_log(path, fields, count=3):
+    """A log with the given fields, as another version of the integration would write it."""
+    timestamps = array("d", ((START + timedelta(hours=hour)).timestamp() for hour in range(count)))
+    columns = {key: array("d", (100.0 + index * 10 + hour for hour in range(count))) for index, key in enumerate(fields)}
+    with open(path, "wb") as file:
+        write_base(file, GasConsume.from_columns(timestamps, columns))
+
+
+def _read_fields(path):
+    with open(path, "rb") as file:
+        _timestamps, columns, fields, _frames, _size = read_log(file)
+    return fields, columns
+
+
+def test_newer_fields_are_kept(tmp_path):
+    path = tmp_path / "gas_actualdata_entry.bin"
+    # A newer version added a field in the middle
+    fields = (*FIELDS[:2], "boiler_temperature", *FIELDS[2:])
+    _write_log(path, fields)
+    data = path.read_bytes()
+
+    gas_consume = fh._load_sync(path)
+
+    assert path.read_bytes() == data
+    assert gas_consume.fields == fields
+
+    gas_consume.add_record(START + timedelta(hours=3), 104.0)
+    gas_consume.recompute(3)
+    fh._save_sync(gas_consume, path)
+    file_fields, columns = _read_fields(path)
+
+    assert file_fields == fields
+    assert list(columns["boiler_temperature"][:3]) == [120.0, 121.0, 122.0]
+    assert math.isnan(columns["boiler_temperature"][3])
+    assert list(columns["consumed_gas"]) == [100.0, 101.0, 102.0, 104.0]
+
+
+def test_newer_fields_survive_compaction(tmp_path):
+    path = tmp_path / "gas_actualdata_entry.bin"
+    fields = (*FIELDS, "boiler_temperature")
+    _write_log(path, fields)
+    gas_consume = fh._load_sync(path)
+
+    path.unlink()
+    fh._save_sync(gas_consume, path)
+
+    file_fields, columns = _read_fields(path)
+    assert file_fields == fields
+    assert list(columns["boiler_temperature"]) == [150.0, 151.0, 152.0]
+
+
+def test_missing_fields_are_added(tmp_path):
+    path = tmp_path / "gas_actualdata_entry.bin"
+    # An older version without the average rate
+    _write_log(path, FIELDS[:-1])
+
+    gas_consume = fh._load_sync(path)
+
+    file_fields, columns = _read_fields(path)
+    assert file_fields == gas_consume.fields == FIELDS
+    assert list(columns["consumed_gas"]) == [100.0, 101.0, 102.0]
+    assert all(math.isnan(value) for value in columns[FIELDS[-1]])